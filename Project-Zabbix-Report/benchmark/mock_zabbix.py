@@ -0,0 +1,269 @@
+import argparse
+import fnmatch
+import gzip
+import json
+import socket
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the Zabbix JSON-RPC API, serving a synthetic fleet.
+# Implements the calls the report scripts make: user.login/logout/
+# checkAuthentication, apiinfo.version, hostgroup.get, host.get, item.get,
+# trend.get and history.get. Values are derived from (itemid, clock), so
+# every run over the same fleet sees the same data. Counts calls and bytes
+# on the wire for the benchmark.
+
+# Item keys every host gets, plus one disk size item per mount and mode
+BASE_KEYS = ["system.cpu.util", "vm.memory.utilization", "icmpping", "zabbix[host,agent,available]"]
+DISK_KEY = "vfs.fs.dependent.size[{mount},{mode}]"
+DISK_MOUNTS = ["/", "/boot", "/var", "C:", "D:"]
+DISK_MODES = ["total", "used", "free", "pused"]
+
+# Seconds between history values of every item
+HISTORY_INTERVAL = 60
+
+AUTH_TOKEN = "0424bd59b807674191e7d77572075f33"
+
+
+class Fleet:
+    # hosts x items x hours of synthetic data, all in one host group
+    def __init__(self, hosts=100, hours=24 * 7, start=None, group="Benchmark"):
+        self.start = int(start if start is not None else time.mktime((2024, 1, 1, 0, 0, 0, 0, 0, -1)))
+        self.end = self.start + hours * 3600
+        self.group = {"groupid": "1", "name": group}
+        self.hosts = [
+            {"hostid": str(10001 + index), "host": f"bench-{index:05d}", "name": f"Bench host {index}",
+             "ip": f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}"}
+            for index in range(hosts)
+        ]
+        keys = BASE_KEYS + [DISK_KEY.format(mount=mount, mode=mode) for mount in DISK_MOUNTS for mode in DISK_MODES]
+        self.items = {}
+        self.items_by_host = {}
+        item_id = 100000
+        for host in self.hosts:
+            for key in keys:
+                item_id += 1
+                item = {"itemid": str(item_id), "hostid": host["hostid"], "key_": key,
+                        "value_type": "3" if key == "icmpping" else "0"}
+                self.items[item["itemid"]] = item
+                self.items_by_host.setdefault(host["hostid"], []).append(item)
+
+    @staticmethod
+    def _value(item_id, clock):
+        return ((item_id * 2654435761 + clock // 60 * 40503) % 10000) / 100
+
+    def trends(self, item_ids, time_from, time_till):
+        first = max(self.start, -(-time_from // 3600) * 3600)
+        last = min(self.end - 3600, time_till)
+        rows = []
+        for item_id in item_ids:
+            if item_id not in self.items:
+                continue
+            number = int(item_id)
+            for clock in range(first, last + 1, 3600):
+                value = self._value(number, clock)
+                rows.append({
+                    "itemid": item_id, "clock": str(clock), "num": "60",
+                    "value_min": f"{value * 0.5:.4f}", "value_avg": f"{value:.4f}",
+                    "value_max": f"{min(100.0, value * 1.5):.4f}"
+                })
+        return rows
+
+    def history(self, item_ids, value_type, time_from, time_till):
+        first = max(self.start, -(-time_from // HISTORY_INTERVAL) * HISTORY_INTERVAL)
+        last = min(self.end - 1, time_till)
+        typed = [item_id for item_id in item_ids if self.items.get(item_id, {}).get("value_type") == value_type]
+        rows = []
+        for clock in range(first, last + 1, HISTORY_INTERVAL):
+            for item_id in typed:
+                rows.append({"itemid": item_id, "clock": str(clock), "value": f"{self._value(int(item_id), clock):.4f}",
+                             "ns": "0"})
+        return rows
+
+
+def _output(row, output):
+    if isinstance(output, list):
+        return {field: row[field] for field in output if field in row}
+    return dict(row)
+
+
+class MockZabbix:
+    # JSON-RPC dispatcher over a Fleet
+    def __init__(self, fleet):
+        self.fleet = fleet
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self.lock:
+            self.calls = {}
+            self.bytes_in = 0
+            self.bytes_out = 0
+
+    def stats(self):
+        with self.lock:
+            return {"calls": dict(self.calls), "bytes_in": self.bytes_in, "bytes_out": self.bytes_out}
+
+    def count(self, method, bytes_in, bytes_out):
+        with self.lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+
+    def dispatch(self, method, params):
+        handler = getattr(self, "_" + method.replace(".", "_"), None)
+        if handler is None:
+            raise KeyError(f"Incorrect method \"{method}\".")
+        return handler(params)
+
+    def _apiinfo_version(self, params):
+        return "6.4.0"
+
+    def _user_login(self, params):
+        return AUTH_TOKEN
+
+    def _user_logout(self, params):
+        return True
+
+    def _user_checkAuthentication(self, params):
+        if params.get("sessionid") != AUTH_TOKEN:
+            raise KeyError("Session terminated, re-login, please.")
+        return {"userid": "1", "username": "Admin"}
+
+    def _hostgroup_get(self, params):
+        wanted = {key: set(values) for key, values in params.get("filter", {}).items()}
+        group = self.fleet.group
+        if any(group.get(key) not in values for key, values in wanted.items()):
+            return []
+        result = {"groupid": group["groupid"]}
+        if "selectHosts" in params:
+            result["hosts"] = [_output(host, params["selectHosts"]) for host in self.fleet.hosts]
+        return [result]
+
+    def _host_get(self, params):
+        host_ids = set(params.get("hostids") or [host["hostid"] for host in self.fleet.hosts])
+        hosts = [host for host in self.fleet.hosts if host["hostid"] in host_ids]
+        if params.get("countOutput"):
+            return str(len(hosts))
+        result = []
+        for host in hosts:
+            row = _output(host, params.get("output", "extend"))
+            if "selectInterfaces" in params:
+                row["interfaces"] = [{"ip": host["ip"], "main": "1", "type": "1"}]
+            result.append(row)
+        return result
+
+    def _item_get(self, params):
+        host_ids = params.get("hostids") or [host["hostid"] for host in self.fleet.hosts]
+        keys = params.get("filter", {}).get("key_")
+        keys = set(keys if isinstance(keys, list) else [keys]) if keys is not None else None
+        search = params.get("search", {}).get("key_")
+        if search is not None and not params.get("searchWildcardsEnabled"):
+            search = f"*{search}*"
+        result = []
+        for host_id in host_ids:
+            for item in self.fleet.items_by_host.get(str(host_id), []):
+                if keys is not None and item["key_"] not in keys:
+                    continue
+                if search is not None and not fnmatch.fnmatchcase(item["key_"], search):
+                    continue
+                result.append(_output(item, params.get("output", "extend")))
+        if params.get("countOutput"):
+            return str(len(result))
+        return result
+
+    def _trend_get(self, params):
+        rows = self.fleet.trends(
+            [str(item_id) for item_id in params.get("itemids", [])],
+            int(params.get("time_from", 0)), int(params.get("time_till", 2 ** 31))
+        )
+        return [_output(row, params.get("output", "extend")) for row in rows]
+
+    def _history_get(self, params):
+        rows = self.fleet.history(
+            [str(item_id) for item_id in params.get("itemids", [])], str(params.get("history", 3)),
+            int(params.get("time_from", 0)), int(params.get("time_till", 2 ** 31))
+        )
+        if params.get("sortorder") == "DESC":
+            rows.reverse()
+        if params.get("limit"):
+            rows = rows[:int(params["limit"])]
+        return [_output(row, params.get("output", "extend")) for row in rows]
+
+
+def make_handler(api, latency=0.0):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            # Headers and body go out in separate writes; without TCP_NODELAY
+            # Nagle's algorithm adds ~40 ms to every keep-alive response
+            super().setup()
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            request = json.loads(body)
+            if latency:
+                time.sleep(latency)
+            try:
+                response = {"jsonrpc": "2.0", "result": api.dispatch(request["method"], request.get("params", {})),
+                            "id": request.get("id")}
+            except KeyError as e:
+                response = {"jsonrpc": "2.0", "id": request.get("id"),
+                            "error": {"code": -32602, "message": "Invalid params.", "data": str(e.args[0])}}
+            payload = json.dumps(response).encode()
+            encoding = self.headers.get("Accept-Encoding", "")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            if "gzip" in encoding:
+                payload = gzip.compress(payload, compresslevel=1)
+                self.send_header("Content-Encoding", "gzip")
+            elif "deflate" in encoding:
+                payload = zlib.compress(payload, 1)
+                self.send_header("Content-Encoding", "deflate")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            api.count(request["method"], len(body), len(payload))
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class MockZabbixServer:
+    # Threaded HTTP server on 127.0.0.1; port 0 picks a free port
+    def __init__(self, fleet, port=0, latency=0.0):
+        self.api = MockZabbix(fleet)
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), make_handler(self.api, latency))
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/zabbix/api_jsonrpc.php"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock Zabbix JSON-RPC server with a synthetic fleet")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--hosts", type=int, default=100)
+    parser.add_argument("--hours", type=int, default=24 * 7)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay added to every response")
+    args = parser.parse_args()
+    server = MockZabbixServer(Fleet(args.hosts, args.hours), args.port, args.latency_ms / 1000)
+    print(f"Serving {args.hosts} hosts x {len(BASE_KEYS) + len(DISK_MOUNTS) * len(DISK_MODES)} items x "
+          f"{args.hours} hours on {server.url}")
+    server.httpd.serve_forever()
@@ -0,0 +1,145 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from mock_zabbix import Fleet, MockZabbixServer
+
+# End-to-end benchmark of the task_report_* scripts against the local mock
+# Zabbix server. Every script runs as its own process in a fresh working
+# directory (no saved session, rollups or metadata cache carried over), with
+# the host group and dates fed to its prompts. Reports wall time, API calls,
+# bytes on the wire and peak RSS per script, and compares them with a stored
+# baseline.
+
+SOS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main", "SOS")
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+SCRIPTS = [
+    "task_report_ICMP-Ping.py",
+    "task_report_Servers-CPU-MEM.py",
+    "task_report_Servers-CPU-MEM-Percentiles.py",
+    "task_report_Servers-L-Disk.py",
+    "task_report_Servers-W-Disk.py",
+    "task_report_ZAA.py",
+    "task_report_all.py"
+]
+
+# Allowed growth over the baseline before a metric counts as a regression
+TOLERANCE = {"wall_seconds": 0.25, "api_calls": 0.0, "bytes": 0.10, "peak_rss_kb": 0.25}
+
+
+def run_script(server, script, fleet, script_args):
+    start_date = datetime.fromtimestamp(fleet.start).strftime("%Y-%m-%d")
+    end_date = datetime.fromtimestamp(fleet.end).strftime("%Y-%m-%d")
+    prompts = f"{fleet.group['name']}\n{start_date}\n{end_date}\n"
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        env = dict(os.environ, ZABBIX_URL=server.url)
+        env.pop("ZABBIX_API_TOKEN", None)
+        command = [
+            sys.executable, os.path.join(SOS_DIR, script),
+            "--session-file", os.path.join(work_dir, "session.json"),
+            "--rollups", os.path.join(work_dir, "rollups.sqlite"),
+            "--metadata-cache", os.path.join(work_dir, "metadata.sqlite"),
+            *script_args
+        ]
+        server.api.reset_stats()
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            command, cwd=work_dir, env=env, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE, text=True
+        )
+        process.stdin.write(prompts)
+        process.stdin.close()
+        stderr = process.stderr.read()
+        # wait4 gives the resource usage of this child alone
+        _, status, usage = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - started
+        process.returncode = os.waitstatus_to_exitcode(status)
+        if process.returncode != 0:
+            raise RuntimeError(f"{script} failed with exit code {process.returncode}:\n{stderr}")
+
+    stats = server.api.stats()
+    return {
+        "wall_seconds": round(wall, 3),
+        "api_calls": sum(stats["calls"].values()),
+        "calls": stats["calls"],
+        "bytes": stats["bytes_in"] + stats["bytes_out"],
+        "peak_rss_kb": usage.ru_maxrss
+    }
+
+
+def compare(results, baseline):
+    # Regressions as (script, metric, baseline value, new value)
+    regressions = []
+    for script, result in results.items():
+        previous = baseline.get(script)
+        if previous is None:
+            continue
+        for metric, tolerance in TOLERANCE.items():
+            if metric in previous and result[metric] > previous[metric] * (1 + tolerance):
+                regressions.append((script, metric, previous[metric], result[metric]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the report scripts against a mock Zabbix server")
+    parser.add_argument("--hosts", type=int, default=200, help="hosts in the synthetic fleet (default: 200)")
+    parser.add_argument("--hours", type=int, default=24 * 7, help="hours of trend data per item (default: 168)")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="delay added to every API response")
+    parser.add_argument("--script", action="append", choices=SCRIPTS, help="script to run; repeat for several")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON file to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--output", metavar="FILE", help="also write the results as JSON")
+    parser.add_argument(
+        "script_args", nargs=argparse.REMAINDER,
+        help="options passed to every script after --, e.g. -- --concurrency 4 --stream"
+    )
+    args = parser.parse_args()
+    script_args = args.script_args[1:] if args.script_args[:1] == ["--"] else args.script_args
+
+    fleet = Fleet(args.hosts, args.hours)
+    server = MockZabbixServer(fleet, latency=args.latency_ms / 1000).start()
+    print(f"Mock Zabbix on {server.url}: {args.hosts} hosts x {len(fleet.items) // max(args.hosts, 1)} items x "
+          f"{args.hours} hours, {args.latency_ms:g} ms latency")
+
+    results = {}
+    try:
+        for script in args.script or SCRIPTS:
+            results[script] = run_script(server, script, fleet, script_args)
+            result = results[script]
+            print(f"{script:46} {result['wall_seconds']:8.2f} s {result['api_calls']:6d} calls "
+                  f"{result['bytes'] / 1024:10.1f} KiB {result['peak_rss_kb'] / 1024:8.1f} MiB RSS")
+    finally:
+        server.stop()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to '{args.baseline}'.")
+        return 0
+    if not os.path.exists(args.baseline):
+        print("No baseline to compare against; run with --save-baseline first.")
+        return 0
+
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f))
+    for script, metric, previous, current in regressions:
+        print(f"REGRESSION {script}: {metric} {previous} -> {current}")
+    if not regressions:
+        print("No regressions against the baseline.")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,11 @@
+import os
+import sys
+
 import requests
-import json
+
+# The shared Zabbix client lives next to the report scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main", "SOS"))
+from zabbix_client import ZabbixClient, ZabbixAPIError
 
 # Zabbix API details
 ZABBIX_URL = "http://172.16.200.110/zabbix/api_jsonrpc.php"
@@ -9,29 +15,7 @@ ZABBIX_PASSWORD = "zabbix"
 # Host ID to associate the web scenario with
 HOST_ID = "10084"
 
-def zabbix_api_call(method, params):
-    headers = {"Content-Type": "application/json"}
-    payload = {
-        "jsonrpc": "2.0",
-        "method": method,
-        "params": params,
-        "auth": None,
-        "id": 1,
-    }
-
-    response = requests.post(ZABBIX_URL, headers=headers, data=json.dumps(payload))
-    response.raise_for_status()
-    return response.json()
-
-def get_auth_token():
-    params = {
-        "username": ZABBIX_USER,
-        "password": ZABBIX_PASSWORD,
-    }
-    result = zabbix_api_call("user.login", params)
-    return result["result"]
-
-def create_web_scenario(auth_token):
+def create_web_scenario(client):
     params = {
         "name": "Example Web Scenario",
         "hostid": HOST_ID,
@@ -51,29 +35,21 @@ def create_web_scenario(auth_token):
         ],
         "delay": 60,  # Interval in seconds
     }
-    payload = {
-        "jsonrpc": "2.0",
-        "method": "httptest.create",
-        "params": params,
-        "auth": auth_token,
-        "id": 1,
-    }
 
-    headers = {"Content-Type": "application/json"}
-    response = requests.post(ZABBIX_URL, headers=headers, data=json.dumps(payload))
-    response.raise_for_status()
-    result = response.json()
-    if "result" in result:
-        print("Web scenario created successfully:", result["result"])
-    else:
-        print("Error creating web scenario:", result)
+    try:
+        result = client.call("httptest.create", params)
+        print("Web scenario created successfully:", result)
+    except ZabbixAPIError as e:
+        print("Error creating web scenario:", e)
 
 def main():
     try:
-        auth_token = get_auth_token()
-        create_web_scenario(auth_token)
+        with ZabbixClient(ZABBIX_URL) as client:
+            client.login(ZABBIX_USER, ZABBIX_PASSWORD)
+            create_web_scenario(client)
+            client.logout()
     except requests.exceptions.RequestException as e:
         print(f"Error: {e}")
 
 if __name__ == "__main__":
-    main()
+    main()
\ No newline at end of file
@@ -0,0 +1,84 @@
+from datetime import timedelta
+
+# Cron-style schedules for report_daemon.py: the five standard fields
+# (minute hour day-of-month month day-of-week) with *, lists, ranges and
+# steps ("*/15", "1-5", "0,30"), plus the @hourly/@daily/@weekly/@monthly
+# shortcuts. As in cron, when both day-of-month and day-of-week are
+# restricted a day matching either one is due. Times are local time.
+
+FIELDS = [("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 6)]
+
+SHORTCUTS = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *"
+}
+
+# No schedule is more than this many days away from a matching day
+# (e.g. "0 0 29 2 *" waits for the next leap year)
+_SEARCH_DAYS = 8 * 366
+
+
+def _parse_field(text, name, low, high):
+    values = set()
+    for part in text.split(","):
+        range_text, _, step_text = part.partition("/")
+        step = int(step_text) if step_text else 1
+        if range_text == "*":
+            start, end = low, high
+        elif "-" in range_text:
+            start, end = (int(value) for value in range_text.split("-", 1))
+        else:
+            start = int(range_text)
+            end = high if step_text else start
+        if name == "weekday" and end == 7:
+            # 7 is Sunday as well as 0
+            values.add(0)
+            end = 6 if start < 7 else start
+        if step < 1 or not low <= start <= end <= high + (name == "weekday"):
+            raise ValueError(f"invalid {name} field {text!r}")
+        values.update(value % 7 if name == "weekday" else value for value in range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    def __init__(self, expression):
+        self.expression = expression
+        fields = SHORTCUTS.get(expression.strip(), expression).split()
+        if len(fields) != len(FIELDS):
+            raise ValueError(f"cron schedule {expression!r} needs {len(FIELDS)} fields: minute hour day month weekday")
+        try:
+            parsed = [_parse_field(text, *field) for text, field in zip(fields, FIELDS)]
+        except ValueError as e:
+            raise ValueError(f"cron schedule {expression!r}: {e}") from None
+        self.minutes, self.hours, self.days, self.months, self.weekdays = parsed
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def _day_matches(self, day):
+        if day.month not in self.months:
+            return False
+        in_month = day.day in self.days
+        # Python's Monday is 0, cron's Sunday is 0
+        in_week = (day.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return in_month and in_week
+        return in_month or in_week
+
+    def next_after(self, moment):
+        # First due minute strictly after `moment` (a naive local datetime)
+        start = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.replace(hour=0, minute=0)
+        for _ in range(_SEARCH_DAYS):
+            if self._day_matches(day):
+                for hour in sorted(self.hours):
+                    for minute in sorted(self.minutes):
+                        candidate = day.replace(hour=hour, minute=minute)
+                        if candidate >= start:
+                            return candidate
+            day += timedelta(days=1)
+        raise ValueError(f"cron schedule {self.expression!r} never runs")
+
+    def __repr__(self):
+        return f"CronSchedule({self.expression!r})"
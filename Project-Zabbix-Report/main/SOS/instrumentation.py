@@ -0,0 +1,174 @@
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# Per-run instrumentation: every JSON-RPC call (count, errors, latency,
+# request/response bytes, result rows) and every pipeline stage (duration,
+# rows). The summary is written as JSON and, for the Prometheus node
+# exporter's textfile collector, in the text exposition format.
+
+QUANTILES = [0.5, 0.9, 0.99]
+
+METRIC_PREFIX = "zabbix_report"
+
+
+def percentile(values, quantile):
+    # Nearest-rank percentile of an unsorted list
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(quantile * len(ordered)) - 1)]
+
+
+class Metrics:
+    # profiler, if given, is a profiling.StageProfiler wrapped around every stage
+    def __init__(self, profiler=None):
+        self.profiler = profiler
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.stages = {}
+
+    def record_call(self, method, seconds, request_bytes=0, response_bytes=0, rows=None, error=False):
+        with self.lock:
+            call = self.calls.setdefault(method, {
+                "count": 0, "errors": 0, "latencies": [], "request_bytes": 0, "response_bytes": 0, "rows": 0
+            })
+            call["count"] += 1
+            call["errors"] += bool(error)
+            call["latencies"].append(seconds)
+            call["request_bytes"] += request_bytes
+            call["response_bytes"] += response_bytes
+            call["rows"] += rows or 0
+
+    def absorb(self, calls, stages=None):
+        # Add the call records and stage timings of another Metrics (e.g. from
+        # a worker process or another server)
+        with self.lock:
+            for name, other in (stages or {}).items():
+                total = self.stages.setdefault(name, {"seconds": 0.0, "rows": None})
+                total["seconds"] += other["seconds"]
+                if other["rows"] is not None:
+                    total["rows"] = (total["rows"] or 0) + other["rows"]
+            for method, other in calls.items():
+                call = self.calls.setdefault(method, {
+                    "count": 0, "errors": 0, "latencies": [], "request_bytes": 0, "response_bytes": 0, "rows": 0
+                })
+                for key in ("count", "errors", "request_bytes", "response_bytes", "rows"):
+                    call[key] += other[key]
+                call["latencies"].extend(other["latencies"])
+
+    @contextmanager
+    def stage(self, name):
+        # with metrics.stage("fetch") as stage: ...; stage["rows"] = n
+        stage = {"rows": None}
+        started = time.perf_counter()
+        try:
+            with self.profiler.stage(name) if self.profiler else nullcontext():
+                yield stage
+        finally:
+            seconds = time.perf_counter() - started
+            with self.lock:
+                total = self.stages.setdefault(name, {"seconds": 0.0, "rows": None})
+                total["seconds"] += seconds
+                if stage["rows"] is not None:
+                    total["rows"] = (total["rows"] or 0) + stage["rows"]
+
+    def summary(self):
+        with self.lock:
+            calls = {}
+            for method, call in sorted(self.calls.items()):
+                latencies = call["latencies"]
+                calls[method] = {
+                    "count": call["count"],
+                    "errors": call["errors"],
+                    "seconds_total": round(sum(latencies), 6),
+                    "seconds_p50": percentile(latencies, 0.5),
+                    "seconds_p90": percentile(latencies, 0.9),
+                    "seconds_p99": percentile(latencies, 0.99),
+                    "seconds_max": max(latencies),
+                    "request_bytes": call["request_bytes"],
+                    "response_bytes": call["response_bytes"],
+                    "rows": call["rows"]
+                }
+            stages = {name: {"seconds": round(stage["seconds"], 6), "rows": stage["rows"]}
+                      for name, stage in self.stages.items()}
+        return {
+            "started": self.started,
+            "seconds": round(time.time() - self.started, 6),
+            "calls": calls,
+            "stages": stages
+        }
+
+    def stage_line(self):
+        # One-line overview printed at the end of a run
+        summary = self.summary()
+        stages = ", ".join(f"{name} {stage['seconds']:.2f}s" for name, stage in summary["stages"].items())
+        calls = sum(call["count"] for call in summary["calls"].values())
+        return f"Timings: {stages}; {calls} API calls in {summary['seconds']:.2f}s"
+
+    def write_json(self, path):
+        _write_atomic(path, json.dumps(self.summary(), indent=2))
+
+    def write_prometheus(self, path, labels=None):
+        # Textfile-collector format; the file is replaced atomically so the
+        # exporter never reads a partial file
+        summary = self.summary()
+        base = dict(labels or {})
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+            for sample_labels, value, suffix in samples:
+                if value is not None:
+                    lines.append(f"{METRIC_PREFIX}_{name}{suffix}{_labels({**base, **sample_labels})} {value}")
+
+        calls = summary["calls"].items()
+        metric("api_calls_total", "counter", "Zabbix API calls per method",
+               [({"method": method}, call["count"], "") for method, call in calls])
+        metric("api_errors_total", "counter", "Failed Zabbix API calls per method",
+               [({"method": method}, call["errors"], "") for method, call in calls])
+        samples = []
+        for method, call in calls:
+            for quantile in QUANTILES:
+                key = f"seconds_p{int(quantile * 100)}"
+                samples.append(({"method": method, "quantile": str(quantile)}, call[key], ""))
+            samples.append(({"method": method}, call["seconds_total"], "_sum"))
+            samples.append(({"method": method}, call["count"], "_count"))
+        metric("api_call_seconds", "summary", "Zabbix API call latency", samples)
+        metric("api_request_bytes_total", "counter", "Request bytes sent per method",
+               [({"method": method}, call["request_bytes"], "") for method, call in calls])
+        metric("api_response_bytes_total", "counter", "Response bytes received per method",
+               [({"method": method}, call["response_bytes"], "") for method, call in calls])
+        metric("api_rows_total", "counter", "Result rows returned per method",
+               [({"method": method}, call["rows"], "") for method, call in calls])
+        stages = summary["stages"].items()
+        metric("stage_seconds", "gauge", "Duration of each pipeline stage",
+               [({"stage": name}, stage["seconds"], "") for name, stage in stages])
+        metric("stage_rows", "gauge", "Rows handled by each pipeline stage",
+               [({"stage": name}, stage["rows"], "") for name, stage in stages])
+        metric("run_seconds", "gauge", "Duration of the report run", [({}, summary["seconds"], "")])
+        metric("last_run_timestamp_seconds", "gauge", "Start time of the report run",
+               [({}, summary["started"], "")])
+        _write_atomic(path, "\n".join(lines) + "\n")
+
+
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_label_value(value)}"' for name, value in labels.items()) + "}"
+
+
+def _write_atomic(path, text):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+import pickle
+import time
+
+from sqlite_store import connect
+
+# Persistent SQLite cache of Zabbix metadata: the hosts of host groups,
+# interface IPs and the item IDs behind each metric. These rarely change,
+# so a report run normally goes straight to trend.get.
+# Every kind of entry has its own TTL. Within the TTL a cached entry is used
+# as is. Once older, it is checked before it is trusted again: the ID list
+# the lookup would return (group member host IDs, matching item IDs) is
+# fetched, a much smaller response than the lookup itself, and compared with
+# the IDs the entry was stored with. An unchanged entry is kept for another
+# TTL; a changed one is fetched again. Entries without such a check are
+# fetched again when their TTL runs out. A check does not cover everything
+# in an entry (e.g. the value type of an item), so every entry is fetched
+# again at the latest MAX_AGE after it was last fetched.
+
+DEFAULT_METADATA_FILE = os.path.join(os.path.expanduser("~"), ".zabbix_report_metadata.sqlite")
+
+# Seconds per kind of entry before it is checked again
+DEFAULT_TTLS = {
+    "groups": 3600,  # hosts of host groups
+    "interfaces": 86400,  # host IPs
+    "items": 86400  # item IDs per (host, metric) and wildcard item searches
+}
+
+# Seconds after which an entry is fetched again even if its check passes
+MAX_AGE = 7 * 86400
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    stored REAL NOT NULL,
+    fetched REAL NOT NULL,
+    signature TEXT,
+    value BLOB NOT NULL,
+    PRIMARY KEY (kind, key)
+) WITHOUT ROWID;
+"""
+
+
+def _digest(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+
+class MetadataCache:
+    # refresh=True fetches every entry stored before this cache was opened
+    # again (once per process), as after a known change in Zabbix
+    def __init__(self, path=DEFAULT_METADATA_FILE, ttls=None, refresh=False):
+        self.path = path
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.refreshed_before = time.time() if refresh else 0
+        self.db = connect(path)
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(entries)")}
+        if columns and "fetched" not in columns:
+            # Entries stored before the age limit are fetched again
+            self.db.execute("ALTER TABLE entries ADD COLUMN fetched REAL NOT NULL DEFAULT 0")
+        self.db.executescript(_SCHEMA)
+
+    def get(self, kind, key, fetch, check=None, signature=None):
+        # The value of (kind, key), from the cache or from fetch().
+        # check() returns the current ID list from the server and
+        # signature(value) the ID list of a fetched value; without them the
+        # entry is simply fetched again after its TTL.
+        key = _digest(key)
+        now = time.time()
+        row = self.db.execute(
+            "SELECT stored, fetched, signature, value FROM entries WHERE kind = ? AND key = ?", (kind, key)
+        ).fetchone()
+        if row is not None and row[0] >= self.refreshed_before:
+            stored, fetched, stored_signature, value = row
+            if now - stored < self.ttls[kind]:
+                return pickle.loads(value)
+            if check is not None and now - fetched < MAX_AGE and stored_signature == _digest(check()):
+                with self.db:
+                    self.db.execute("UPDATE entries SET stored = ? WHERE kind = ? AND key = ?", (now, kind, key))
+                return pickle.loads(value)
+
+        value = fetch()
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO entries (kind, key, stored, fetched, signature, value)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, key, now, now, _digest(signature(value)) if signature else None, pickle.dumps(value))
+            )
+        return value
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,78 @@
+import cProfile
+import io
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# --profile support: cProfile and tracemalloc around every pipeline stage.
+# For each stage two files are written next to the report:
+#   <prefix>-profile-<stage>.pstats  raw cProfile stats (pstats, snakeviz, ...)
+#   <prefix>-profile-<stage>.txt     top functions by cumulative time and the
+#                                    allocations that grew most in the stage
+# A stage that runs more than once in a run gets -2, -3, ... appended to its
+# name. cProfile only sees the main thread; run with --concurrency 1 to get
+# the API calls and response decoding into the profile.
+
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+
+# Frames kept per allocation traceback
+TRACEBACK_FRAMES = 10
+
+# Allocations made by the profilers themselves are left out of the report
+_OWN_ALLOCATIONS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, cProfile.__file__),
+    tracemalloc.Filter(False, pstats.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>")
+]
+
+
+class StageProfiler:
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.files = []
+        self.runs = {}
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEBACK_FRAMES)
+
+    @contextmanager
+    def stage(self, name):
+        before = tracemalloc.take_snapshot().filter_traces(_OWN_ALLOCATIONS)
+        tracemalloc.reset_peak()
+        profile = cProfile.Profile()
+        started = time.perf_counter()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            seconds = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot().filter_traces(_OWN_ALLOCATIONS)
+            growth = [stat for stat in after.compare_to(before, "lineno") if stat.size_diff > 0]
+            self._write(name, profile, seconds, peak, growth)
+
+    def _write(self, name, profile, seconds, peak, allocations):
+        self.runs[name] = self.runs.get(name, 0) + 1
+        if self.runs[name] > 1:
+            name = f"{name}-{self.runs[name]}"
+        stats_path = f"{self.prefix}-profile-{name}.pstats"
+        text_path = f"{self.prefix}-profile-{name}.txt"
+        profile.dump_stats(stats_path)
+
+        buffer = io.StringIO()
+        stats = pstats.Stats(profile, stream=buffer)
+        stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        with open(text_path, "w", encoding="utf-8") as f:
+            f.write(f"Stage: {name}\n")
+            f.write(f"Wall time: {seconds:.3f} s\n")
+            f.write(f"Peak traced memory: {peak / 1024 ** 2:.1f} MiB\n\n")
+            f.write(f"Top {TOP_ALLOCATIONS} allocation sites by growth during the stage:\n")
+            for stat in allocations[:TOP_ALLOCATIONS]:
+                f.write(f"  {stat}\n")
+            f.write(f"\nTop {TOP_FUNCTIONS} functions by cumulative time:\n")
+            f.write(buffer.getvalue())
+        self.files.extend([stats_path, text_path])
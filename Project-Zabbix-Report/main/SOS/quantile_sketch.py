@@ -0,0 +1,134 @@
+import math
+
+import numpy as np
+
+# Mergeable quantile sketches for the percentile columns (stat = "p95").
+# Values are counted in logarithmic bins (the DDSketch scheme): bin k holds
+# the magnitudes in (GAMMA^(k-1), GAMMA^k], so every value in a bin is within
+# RELATIVE_ACCURACY of the bin's representative value. A quantile read from
+# a sketch is therefore within 1% of the true value of that rank (for the
+# nearest-rank definition), however many values went in. Two sketches merge
+# by adding their bin counts, which gives exactly the sketch of all values,
+# so sketches built per time slice, batch, shard or day merge like the
+# min/max/sum/count partials.
+# A sketch holds at most MAX_BINS bins. Values spanning 1% bins from 1e-9 to
+# 1e9 need about 2,100 bins; if there are more, the bins closest to zero are
+# folded into the zero bin, which only affects quantiles of values more than
+# ~17 orders of magnitude below the largest ones.
+
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(GAMMA)
+
+# Magnitudes below this are counted as zero
+MIN_VALUE = 1e-9
+
+MAX_BINS = 2048
+
+# Shifts the bins of positive values above 0 (the zero bin); negative values
+# use the mirrored negative indexes
+_OFFSET = 1 - math.ceil(math.log(MIN_VALUE) / _LOG_GAMMA)
+
+
+def bin_indexes(values):
+    # Bin index of every value, increasing with the value
+    magnitudes = np.abs(values)
+    indexes = np.zeros(len(values), dtype=np.int64)
+    nonzero = magnitudes >= MIN_VALUE
+    indexes[nonzero] = np.ceil(np.log(magnitudes[nonzero]) / _LOG_GAMMA).astype(np.int64) + _OFFSET
+    return np.where(values < 0, -indexes, indexes)
+
+
+def bin_index(value):
+    # bin_indexes() for a single value, for the row-at-a-time stream path
+    magnitude = abs(value)
+    if magnitude < MIN_VALUE:
+        return 0
+    index = math.ceil(math.log(magnitude) / _LOG_GAMMA) + _OFFSET
+    return -index if value < 0 else index
+
+
+def bin_values(indexes):
+    # Representative value of every bin: 2 * GAMMA^k / (GAMMA + 1) is within
+    # RELATIVE_ACCURACY of both bin bounds
+    magnitudes = 2 * GAMMA ** (np.abs(indexes) - _OFFSET).astype(np.float64) / (GAMMA + 1)
+    return np.where(indexes == 0, 0.0, np.where(indexes < 0, -magnitudes, magnitudes))
+
+
+class QuantileSketch:
+    __slots__ = ("indexes", "weights")
+
+    def __init__(self, indexes, weights):
+        # Sorted, distinct bin indexes and the total weight in each
+        self.indexes = indexes
+        self.weights = weights
+        if len(indexes) > MAX_BINS:
+            self._collapse()
+
+    @classmethod
+    def from_bins(cls, bins):
+        # From a {bin index: weight} dict
+        indexes = np.array(sorted(bins), dtype=np.int64)
+        return cls(indexes, np.array([bins[index] for index in indexes], dtype=np.float64))
+
+    @classmethod
+    def merge(cls, sketches):
+        sketches = [sketch for sketch in sketches if isinstance(sketch, QuantileSketch)]
+        if len(sketches) == 1:
+            return sketches[0]
+        if not sketches:
+            return None
+        indexes, positions = np.unique(
+            np.concatenate([sketch.indexes for sketch in sketches]), return_inverse=True
+        )
+        weights = np.bincount(positions, weights=np.concatenate([sketch.weights for sketch in sketches]))
+        return cls(indexes, weights)
+
+    def _collapse(self):
+        # Fold the bins closest to zero into the zero bin
+        keep = np.sort(np.argsort(np.abs(self.indexes), kind="stable")[len(self.indexes) - MAX_BINS + 1:])
+        folded = np.ones(len(self.indexes), dtype=bool)
+        folded[keep] = False
+        indexes = np.append(self.indexes[keep], 0)
+        weights = np.append(self.weights[keep], self.weights[folded].sum())
+        order = np.argsort(indexes, kind="stable")
+        self.indexes = indexes[order]
+        self.weights = weights[order]
+
+    def quantile(self, q):
+        # Nearest-rank quantile for 0 < q <= 1 (the smallest value with at
+        # least a q share of the weight at or below it), NaN when empty
+        if not len(self.weights):
+            return float("nan")
+        cumulative = np.cumsum(self.weights)
+        position = np.searchsorted(cumulative, q * cumulative[-1], side="left")
+        return float(bin_values(self.indexes[[min(position, len(self.indexes) - 1)]])[0])
+
+    def to_bytes(self):
+        # (indexes, weights) blobs for the rollup store
+        return self.indexes.tobytes(), self.weights.tobytes()
+
+    @classmethod
+    def from_bytes(cls, indexes, weights):
+        return cls(np.frombuffer(indexes, dtype=np.int64), np.frombuffer(weights, dtype=np.float64))
+
+
+def build_sketches(keys, values, weights):
+    # {key: QuantileSketch} over parallel int64 key / float64 value and weight
+    # arrays, in one vectorized pass: sort by (key, bin), sum the weight of
+    # every run of equal pairs, then split the runs per key
+    if not len(keys):
+        return {}
+    indexes = bin_indexes(values)
+    order = np.lexsort((indexes, keys))
+    keys, indexes, weights = keys[order], indexes[order], weights[order]
+    runs = np.flatnonzero(np.concatenate(([True], (keys[1:] != keys[:-1]) | (indexes[1:] != indexes[:-1]))))
+    run_keys = keys[runs]
+    run_indexes = indexes[runs]
+    run_weights = np.add.reduceat(weights, runs)
+    starts = np.flatnonzero(np.concatenate(([True], run_keys[1:] != run_keys[:-1])))
+    ends = [*starts[1:], len(run_keys)]
+    return {
+        int(run_keys[start]): QuantileSketch(run_indexes[start:end], run_weights[start:end])
+        for start, end in zip(starts, ends)
+    }
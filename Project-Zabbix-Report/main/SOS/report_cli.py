@@ -0,0 +1,191 @@
+import argparse
+import os
+
+from metadata_cache import DEFAULT_METADATA_FILE, DEFAULT_TTLS, MetadataCache
+from report_writers import FORMAT_EXTENSIONS
+from trend_cache import DEFAULT_MAX_ROWS, TrendCache
+from trend_rollup import DEFAULT_ROLLUP_FILE, DailyRollups
+from zabbix_auth import DEFAULT_SESSION_FILE
+from zabbix_client import DEFAULT_POOL_SIZE, DEFAULT_RETRIES, DEFAULT_TIMEOUT
+
+# Command-line options shared by the task_report_* scripts. Host groups and
+# dates are still asked for interactively.
+
+# Trend cache and rollup stores opened so far, see _open_store()
+_stores = {}
+
+
+def parse_args(description, add_arguments=None):
+    # add_arguments(parser), if given, registers script-specific options
+    parser = argparse.ArgumentParser(description=description)
+    if add_arguments:
+        add_arguments(parser)
+    parser.add_argument(
+        "--concurrency", type=int, default=1,
+        help="maximum number of Zabbix API requests kept in flight at once (default: 1); the actual"
+             " number adapts to the frontend's latency and errors unless --fixed-concurrency is given"
+    )
+    parser.add_argument(
+        "--fixed-concurrency", action="store_true",
+        help="always keep --concurrency requests in flight instead of adapting"
+    )
+    parser.add_argument(
+        "--retries", type=int, default=DEFAULT_RETRIES,
+        help=f"retries of a call after a timeout, connection error or HTTP 429/5xx (default: {DEFAULT_RETRIES})"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=DEFAULT_TIMEOUT[1],
+        help=f"seconds to wait for a response before retrying (default: {DEFAULT_TIMEOUT[1]})"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="split the hosts into this many shards fetched and aggregated in parallel processes (default: 1)"
+    )
+    parser.add_argument(
+        "--slice-days", type=float, default=None,
+        help="split the reporting window into slices of this many days, fetched in parallel"
+    )
+    parser.add_argument(
+        "--servers", metavar="FILE",
+        help="TOML file of [[server]] entries (name, url, credentials) to report on instead of ZABBIX_URL;"
+             " all servers are queried at the same time and every report gets their rows with a Server column"
+    )
+    parser.add_argument(
+        "--session-file", metavar="FILE", default=DEFAULT_SESSION_FILE,
+        help=f"file keeping the Zabbix session between runs so user.login is skipped while the session"
+             f" is valid (default: {DEFAULT_SESSION_FILE})"
+    )
+    parser.add_argument(
+        "--logout", action="store_true",
+        help="log in for this run only and log out when done instead of reusing a saved session"
+    )
+    parser.add_argument(
+        "--cache", metavar="FILE", default=None,
+        help="SQLite file caching closed trend hours between runs; only missing ranges are fetched"
+    )
+    parser.add_argument(
+        "--cache-max-rows", type=int, default=DEFAULT_MAX_ROWS,
+        help=f"evict least recently used items once the cache holds more rows (default: {DEFAULT_MAX_ROWS})"
+    )
+    parser.add_argument(
+        "--rollups", metavar="FILE", default=DEFAULT_ROLLUP_FILE,
+        help=f"SQLite file of per-item daily rollups written by every run; whole days already rolled up"
+             f" are not fetched again (default: {DEFAULT_ROLLUP_FILE})"
+    )
+    parser.add_argument(
+        "--no-rollups", action="store_true",
+        help="neither read nor write daily rollups"
+    )
+    parser.add_argument(
+        "--metadata-cache", metavar="FILE", default=DEFAULT_METADATA_FILE,
+        help=f"SQLite file caching host group members, host IPs and item IDs between runs"
+             f" (default: {DEFAULT_METADATA_FILE})"
+    )
+    parser.add_argument(
+        "--no-metadata-cache", action="store_true",
+        help="look up hosts and items on every run"
+    )
+    parser.add_argument(
+        "--metadata-ttl", metavar="KIND=SECONDS", action="append", default=[],
+        help="seconds cached metadata of a kind (" + ", ".join(DEFAULT_TTLS) + ") is used before it is checked"
+             " against Zabbix again; repeat for several (defaults: "
+             + ", ".join(f"{kind}={ttl}" for kind, ttl in DEFAULT_TTLS.items()) + ")"
+    )
+    parser.add_argument(
+        "--refresh-metadata", action="store_true",
+        help="fetch all cached metadata again, e.g. after hosts or items were changed in Zabbix"
+    )
+    parser.add_argument(
+        "--stream", action="store_true",
+        help="decode trend.get responses incrementally into running aggregates to keep memory flat"
+    )
+    parser.add_argument(
+        "--source", choices=["auto", "trend", "history"], default="auto",
+        help="data source: auto uses history.get for short recent windows and for the hours"
+             " trends do not cover yet, trend.get otherwise (default: auto)"
+    )
+    parser.add_argument(
+        "--bucket", choices=["day", "week", "month"], default=None,
+        help="also break every column down per day, ISO week or month, computed from the same single fetch"
+    )
+    parser.add_argument(
+        "--metrics", metavar="FILE",
+        help="write a JSON summary of API calls (counts, latency percentiles, bytes, rows) and stage timings"
+    )
+    parser.add_argument(
+        "--prometheus", metavar="FILE",
+        help="write the same metrics for the Prometheus node exporter's textfile collector (*.prom)"
+    )
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="profile every stage with cProfile and tracemalloc; stats are written next to the report"
+             " as <report>-profile-<stage>.pstats/.txt"
+    )
+    parser.add_argument(
+        "--output-dir", metavar="DIR",
+        help="directory the reports (and profiles) are written to (default: the current directory)"
+    )
+    parser.add_argument(
+        "--format", choices=sorted(FORMAT_EXTENSIONS), default="xlsx",
+        help="report output format (default: xlsx); parquet needs pyarrow"
+    )
+    args = parser.parse_args()
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.retries < 0:
+        parser.error("--retries must not be negative")
+    if args.timeout <= 0:
+        parser.error("--timeout must be positive")
+    if args.slice_days is not None and args.slice_days <= 0:
+        parser.error("--slice-days must be positive")
+    if getattr(args, "workbook", None) and args.format != "xlsx":
+        parser.error("--workbook always writes an Excel workbook; it cannot be combined with --format " + args.format)
+    ttls = {}
+    for option in args.metadata_ttl:
+        kind, _, seconds = option.partition("=")
+        try:
+            ttls[kind] = float(seconds)
+        except ValueError:
+            parser.error(f"--metadata-ttl {option}: expected KIND=SECONDS")
+        if kind not in DEFAULT_TTLS or ttls[kind] < 0:
+            parser.error(f"--metadata-ttl {option}: KIND is one of {', '.join(DEFAULT_TTLS)} and SECONDS not negative")
+    args.metadata_ttl = ttls
+    return args
+
+
+def client_options(args):
+    # ZabbixClient keyword arguments for the request-layer options
+    return {
+        "pool_size": max(DEFAULT_POOL_SIZE, args.concurrency),
+        "timeout": (DEFAULT_TIMEOUT[0], args.timeout),
+        "retries": args.retries,
+        "max_concurrency": None if args.fixed_concurrency else args.concurrency
+    }
+
+
+def _open_store(store, path, *options):
+    # One open store per file and process, kept for later runs in the same
+    # process (report_daemon.py); worker processes open their own
+    key = (os.getpid(), store, path)
+    if key not in _stores:
+        _stores[key] = store(path, *options)
+    return _stores[key]
+
+
+def open_cache(args):
+    # TrendCache for --cache, or None when caching is disabled
+    return _open_store(TrendCache, args.cache, args.cache_max_rows) if args.cache else None
+
+
+def open_metadata(args):
+    # MetadataCache for --metadata-cache, or None with --no-metadata-cache
+    if args.no_metadata_cache:
+        return None
+    return _open_store(MetadataCache, args.metadata_cache, args.metadata_ttl, args.refresh_metadata)
+
+
+def open_rollups(args):
+    # DailyRollups for --rollups, or None with --no-rollups
+    return None if args.no_rollups else _open_store(DailyRollups, args.rollups)
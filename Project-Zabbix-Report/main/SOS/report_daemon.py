@@ -0,0 +1,234 @@
+import copy
+import os
+import signal
+import sys
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+try:
+    import tomllib
+except ModuleNotFoundError:  # Python < 3.11
+    import tomli as tomllib
+
+from cron_schedule import CronSchedule
+from report_cli import parse_args
+from report_engine import (available_reports, collect_reports, connect, default_server, load_definition,
+                           load_servers, save_reports)
+from report_writers import FORMAT_EXTENSIONS
+from zabbix_auth import authenticate
+
+# Long-running scheduler for the report definitions in reports/*.toml.
+# Jobs come from a TOML file of [[job]] entries, each with a cron schedule,
+# the reports to run, the host groups and the window (see
+# jobs.example.toml). The daemon keeps one pooled, authenticated client per
+# server and the metadata cache, trend cache and daily rollup stores open
+# between runs. A daily report then fetches the day that is new since the
+# last run and the day before it, whose rollup is still provisional (see
+# trend_rollup.RECHECK_SECONDS); the other days come from the rollups.
+# Reports are written atomically. SIGTERM or Ctrl+C stops the daemon after
+# the running job.
+#
+#   python report_daemon.py jobs.toml [--servers servers.toml] [options]
+
+# Longest sleep between checks, so clock changes are noticed
+MAX_SLEEP = 60
+
+# Job keys that override the command-line option of the same name
+JOB_OPTIONS = {
+    "format": sorted(FORMAT_EXTENSIONS),
+    "bucket": ["day", "week", "month"],
+    "source": ["auto", "trend", "history"],
+    "workbook": None,
+    "output_dir": None
+}
+
+WINDOWS = ["week", "month"]
+
+
+class Job:
+    def __init__(self, name, schedule, definitions, groups, days=1, window=None, options=None):
+        self.name = name
+        self.schedule = schedule
+        self.definitions = definitions
+        self.groups = groups
+        self.days = days
+        self.window = window
+        self.options = options or {}
+
+
+def load_jobs(path):
+    with open(path, "rb") as f:
+        data = tomllib.load(f)
+
+    jobs = []
+    for entry in data.get("job", []):
+        missing = {"name", "schedule", "groups"} - set(entry)
+        if missing:
+            raise ValueError(f"{path}: [[job]] {entry.get('name', '')!r} is missing {sorted(missing)}")
+        name = entry["name"]
+        try:
+            schedule = CronSchedule(entry["schedule"])
+        except ValueError as e:
+            raise ValueError(f"{path}: job {name!r}: {e}") from None
+        reports = entry.get("reports", available_reports())
+        unknown = sorted(set(reports) - set(available_reports()))
+        if unknown:
+            raise ValueError(f"{path}: job {name!r} has unknown reports {unknown}")
+        window = entry.get("window")
+        if window is not None and window not in WINDOWS:
+            raise ValueError(f"{path}: job {name!r}: window must be one of {WINDOWS}")
+        days = entry.get("days", 1)
+        if not isinstance(days, int) or days < 1:
+            raise ValueError(f"{path}: job {name!r}: days must be a positive whole number")
+        options = {key: value for key, value in entry.items() if key in JOB_OPTIONS}
+        for key, value in options.items():
+            if JOB_OPTIONS[key] is not None and value not in JOB_OPTIONS[key]:
+                raise ValueError(f"{path}: job {name!r}: {key} must be one of {JOB_OPTIONS[key]}")
+        jobs.append(Job(
+            name, schedule, [load_definition(report) for report in reports], [str(group) for group in entry["groups"]],
+            days, window, options
+        ))
+
+    if not jobs:
+        raise ValueError(f"{path}: no [[job]] entries")
+    names = [job.name for job in jobs]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"{path}: duplicate job names {duplicates}")
+    return jobs
+
+
+def job_dates(job, moment):
+    # (start_date, end_date) as they would be typed at the prompts, both
+    # included: the `days` days before the day of the run, or the previous
+    # calendar week (Monday to Sunday) or month. The day of the run is never
+    # part of the window.
+    today = moment.date()
+    if job.window == "week":
+        start = today - timedelta(days=today.weekday() + 7)
+        end = start + timedelta(days=6)
+    elif job.window == "month":
+        end = today.replace(day=1) - timedelta(days=1)
+        start = end.replace(day=1)
+    else:
+        end = today - timedelta(days=1)
+        start = today - timedelta(days=job.days)
+    return start.isoformat(), end.isoformat()
+
+
+def log(message):
+    print(f"{datetime.now():%Y-%m-%d %H:%M:%S} {message}", flush=True)
+
+
+class ReportDaemon:
+    def __init__(self, jobs, servers, args):
+        self.jobs = jobs
+        self.servers = servers
+        self.args = args
+        # server name -> (client, keep_session)
+        self.clients = {}
+
+    def client(self, server):
+        # The server's pooled client, connected on first use. A saved
+        # session can expire between runs; it is checked with the cheap
+        # user.checkAuthentication and renewed when needed.
+        if server.name not in self.clients:
+            client, keep_session = connect(server, self.args)
+            self.clients[server.name] = (client, keep_session)
+            return client
+        client, keep_session = self.clients[server.name]
+        if client.auth_token is not None and not client.use_session(client.auth_token):
+            keep_session = authenticate(
+                client, server.username, server.password, server.api_token,
+                None if self.args.logout else self.args.session_file
+            )
+            self.clients[server.name] = (client, keep_session)
+        return client
+
+    def job_args(self, job, start_date, end_date):
+        args = copy.copy(self.args)
+        for key, value in job.options.items():
+            setattr(args, key, value)
+        # File names may contain {job}, {start_date} and {end_date}
+        fields = {"job": job.name, "start_date": start_date, "end_date": end_date}
+        for key in ("output_dir", "workbook", "metrics", "prometheus"):
+            if getattr(args, key, None):
+                setattr(args, key, getattr(args, key).format(**fields))
+        if args.output_dir:
+            os.makedirs(args.output_dir, exist_ok=True)
+        return args
+
+    def run_job(self, job, moment):
+        # Returns False if the job failed; the daemon carries on either way
+        start_date, end_date = job_dates(job, moment)
+        log(f"Job {job.name}: {start_date} to {end_date}")
+        try:
+            args = self.job_args(job, start_date, end_date)
+            clients = {server.name: self.client(server) for server in self.servers}
+            reports, metadata, metrics = collect_reports(
+                job.definitions, self.servers, job.groups, start_date, end_date, args, clients
+            )
+            if not reports:
+                log(f"Job {job.name}: no hosts found in the specified host groups.")
+                return True
+            save_reports(reports, metadata, metrics, job.definitions, args, {"report_job": job.name})
+        except Exception:
+            traceback.print_exc()
+            log(f"Job {job.name} failed.")
+            return False
+        log(f"Job {job.name} done.")
+        return True
+
+    def serve(self, stop):
+        due = {job.name: job.schedule.next_after(datetime.now()) for job in self.jobs}
+        for job in self.jobs:
+            log(f"Job {job.name} ({job.schedule.expression}) next runs at {due[job.name]:%Y-%m-%d %H:%M}.")
+        while not stop.is_set():
+            job = min(self.jobs, key=lambda job: due[job.name])
+            wait = (due[job.name] - datetime.now()).total_seconds()
+            if wait > 0:
+                stop.wait(min(wait, MAX_SLEEP))
+                continue
+            self.run_job(job, due[job.name])
+            # Runs missed while a job was running are skipped, as cron does
+            due[job.name] = job.schedule.next_after(max(datetime.now(), due[job.name]))
+            log(f"Job {job.name} next runs at {due[job.name]:%Y-%m-%d %H:%M}.")
+
+    def close(self):
+        for client, keep_session in self.clients.values():
+            if not keep_session:
+                client.logout()
+            client.close()
+        self.clients.clear()
+
+
+def main():
+    def add_arguments(parser):
+        parser.add_argument("jobs", metavar="JOBS_FILE", help="TOML file of [[job]] entries")
+        parser.add_argument("--once", action="store_true", help="run every job once now and exit")
+
+    args = parse_args("Run Zabbix reports on cron-style schedules", add_arguments)
+    jobs = load_jobs(args.jobs)
+    for job in jobs:
+        if job.options.get("workbook") and job.options.get("format", args.format) != "xlsx":
+            sys.exit(f"{args.jobs}: job {job.name!r}: a workbook is always xlsx; it cannot be combined with format "
+                     f"{job.options.get('format', args.format)}")
+    servers = load_servers(args.servers) if args.servers else [default_server()]
+    daemon = ReportDaemon(jobs, servers, args)
+    try:
+        if args.once:
+            results = [daemon.run_job(job, datetime.now()) for job in jobs]
+            return 0 if all(results) else 1
+        stop = threading.Event()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signal_number, lambda *_: stop.set())
+        daemon.serve(stop)
+        log("Stopped.")
+        return 0
+    finally:
+        daemon.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,631 @@
+import copy
+import functools
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+try:
+    import tomllib
+except ModuleNotFoundError:  # Python < 3.11
+    import tomli as tomllib
+
+from instrumentation import Metrics
+from profiling import StageProfiler
+from report_cli import client_options, open_cache, open_metadata, open_rollups, parse_args
+from report_writers import output_path, write_report, write_workbook
+from trend_aggregate import aggregate_by_metric, bucket_label, bucket_starts, collapse_buckets, merge_partials
+from zabbix_auth import authenticate
+from zabbix_client import ZabbixClient
+from zabbix_fetch import (get_hosts_from_groups, get_host_ips, get_item_map, get_summary, host_signature,
+                          list_group_hosts, list_item_ids, search_items)
+
+# Report engine driven by the definitions in reports/*.toml.
+# A definition lists the item keys per metric, the scaling, the output
+# columns and the sheet/file names. Instead of fixed keys a definition can
+# [discover] its metrics: one wildcard item.get finds the matching items and
+# the metrics and columns are built from what the hosts actually have.
+# Any number of definitions run in one pass: hosts and items are resolved once for the union of their keys and
+# trends are fetched once, then every report is built from the shared data.
+# With --servers the same pass runs on several Zabbix servers at once and the
+# reports combine the rows of all of them.
+
+# Zabbix API details; the environment overrides the defaults
+ZABBIX_URL = os.environ.get("ZABBIX_URL", "http://url/zabbix/api_jsonrpc.php")
+USERNAME = os.environ.get("ZABBIX_USERNAME", "username")
+PASSWORD = os.environ.get("ZABBIX_PASSWORD", "password")
+# A Zabbix API token, if set, is used instead of USERNAME/PASSWORD
+API_TOKEN = os.environ.get("ZABBIX_API_TOKEN")
+
+# Server names end up in file names (per-server cache and rollups)
+SERVER_NAME = re.compile(r"[A-Za-z0-9_.-]+")
+
+REPORTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reports")
+
+HOST_COLUMNS = ["Host ID", "Hostname", "IP Address"]
+
+# Leading column of federated reports
+SERVER_COLUMN = "Server"
+
+STATS = ["min", "avg", "max"]
+
+# Percentile stats ("p95", "p99.9") are read from per-item quantile sketches
+# (quantile_sketch.py), within 1% of the exact value
+PERCENTILE_STAT = re.compile(r"p[1-9][0-9]?(\.[0-9]+)?")
+
+# Named unit conversions accepted as `scale` in a definition
+SCALES = {
+    "GB": 1 / 1024 ** 3,  # bytes to GB
+    "percent": 100  # 0..1 ratios to percent
+}
+
+
+class ReportDefinition:
+    def __init__(self, name, keys, columns, output, sheet="Zabbix Report", scale=1, description=None,
+                 discover=None):
+        self.name = name
+        self.keys = keys
+        self.columns = columns
+        self.discover = discover
+        self.output = output
+        self.sheet = sheet
+        self.scale = SCALES.get(scale, scale)
+        self.description = description or f"{name} report"
+
+
+class ZabbixServer:
+    def __init__(self, name, url, username=None, password=None, api_token=None):
+        self.name = name
+        self.url = url
+        self.username = username
+        self.password = password
+        self.api_token = api_token
+
+
+def load_servers(path):
+    # [[server]] entries of a --servers file: name, url and either username
+    # and password or api_token. A credential can instead name the
+    # environment variable holding it (username_env, password_env,
+    # api_token_env) so secrets stay out of the file.
+    with open(path, "rb") as f:
+        data = tomllib.load(f)
+
+    servers = []
+    for entry in data.get("server", []):
+        if "name" not in entry or "url" not in entry:
+            raise ValueError(f"{path}: every [[server]] needs a name and a url")
+        name = entry["name"]
+        if not SERVER_NAME.fullmatch(name):
+            raise ValueError(f"{path}: server name {name!r} may only contain letters, digits, '_', '.' and '-'")
+        credentials = {}
+        for field in ("username", "password", "api_token"):
+            variable = entry.get(f"{field}_env")
+            if variable is None:
+                credentials[field] = entry.get(field)
+            elif variable in os.environ:
+                credentials[field] = os.environ[variable]
+            else:
+                raise ValueError(f"{path}: environment variable {variable} for server {name!r} is not set")
+        if not credentials["api_token"] and not (credentials["username"] and credentials["password"]):
+            raise ValueError(f"{path}: server {name!r} needs username and password or an api_token")
+        servers.append(ZabbixServer(name, entry["url"], **credentials))
+
+    if not servers:
+        raise ValueError(f"{path}: no [[server]] entries")
+    names = [server.name for server in servers]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"{path}: duplicate server names {duplicates}")
+    return servers
+
+
+def is_stat(stat):
+    return stat in STATS or isinstance(stat, str) and PERCENTILE_STAT.fullmatch(stat) is not None
+
+
+def percentile_stats(definition):
+    # Percentile stats used by the definition's columns, discovered ones included
+    stats = [column["stat"] for column in definition.columns]
+    if definition.discover:
+        stats.append(definition.discover.get("stat", "avg"))
+    return sorted({stat for stat in stats if stat not in STATS}, key=lambda stat: float(stat[1:]))
+
+
+def available_reports():
+    return sorted(os.path.splitext(name)[0] for name in os.listdir(REPORTS_DIR) if name.endswith(".toml"))
+
+
+def load_definition(name_or_path):
+    # Load reports/<name>.toml, or a definition file given by path
+    if name_or_path.endswith(".toml"):
+        path = name_or_path
+    else:
+        path = os.path.join(REPORTS_DIR, f"{name_or_path}.toml")
+    name = os.path.splitext(os.path.basename(path))[0]
+    with open(path, "rb") as f:
+        data = tomllib.load(f)
+
+    keys = data.get("keys", {})
+    discover = data.get("discover")
+    if not keys and not discover:
+        raise ValueError(f"{path}: needs [keys] or [discover]")
+    if not all(isinstance(key_list, list) for key_list in keys.values()):
+        raise ValueError(f"{path}: [keys] must map each metric to a list of item keys")
+    if discover:
+        missing = {"search", "pattern", "metric", "modes"} - set(discover)
+        if missing:
+            raise ValueError(f"{path}: [discover] is missing {sorted(missing)}")
+        discover["pattern"] = re.compile(discover["pattern"])
+        if not {"mount", "mode"} <= set(discover["pattern"].groupindex):
+            raise ValueError(f"{path}: [discover] pattern needs (?P<mount>...) and (?P<mode>...) groups")
+        if not is_stat(discover.get("stat", "avg")):
+            raise ValueError(f"{path}: [discover] stat must be one of {STATS} or a percentile such as p95")
+    columns = data.get("columns", [])
+    for column in columns:
+        if column.get("metric") not in keys or not is_stat(column.get("stat")) or "title" not in column:
+            raise ValueError(
+                f"{path}: invalid column {column}; needs title, a metric from [keys] and stat in {STATS}"
+                " or a percentile such as p95"
+            )
+    scale = data.get("scale", 1)
+    if isinstance(scale, str) and scale not in SCALES:
+        raise ValueError(f"{path}: unknown scale {scale!r}; use a number or one of {sorted(SCALES)}")
+    if "output" not in data:
+        raise ValueError(f"{path}: missing output file name")
+
+    return ReportDefinition(
+        name, keys, columns, data["output"], data.get("sheet", "Zabbix Report"), scale, data.get("description"),
+        discover
+    )
+
+
+def discover_metrics(definition, items, item_map):
+    # Turn the wildcard-matched items into metrics and columns: the key is
+    # parsed into mount and mode, each mount gets one column per mode.
+    # Adds the items to item_map and returns the expanded definition.
+    spec = definition.discover
+    labels = spec.get("labels", {})
+    mounts = set()
+    for item in items:
+        match = spec["pattern"].match(item["key_"])
+        if not match or match["mode"] not in spec["modes"]:
+            continue
+        mount = match["mount"]
+        mounts.add(mount)
+        metric = spec["metric"].format(mount=mount, label=labels.get(mount, mount), mode=spec["modes"][match["mode"]])
+        item_map.setdefault((item["hostid"], (definition.name, metric)), []).append(item["itemid"])
+
+    # Well-known mounts first, in the order of their labels, then the rest by path
+    ordered = [mount for mount in labels if mount in mounts] + sorted(mounts - set(labels))
+    expanded = copy.copy(definition)
+    expanded.keys = dict(definition.keys)
+    expanded.columns = list(definition.columns)
+    for mount in ordered:
+        for mode, title in spec["modes"].items():
+            metric = spec["metric"].format(mount=mount, label=labels.get(mount, mount), mode=title)
+            expanded.keys[metric] = []
+            expanded.columns.append({"title": metric, "metric": metric, "stat": spec.get("stat", "avg")})
+    return expanded
+
+
+def build_report(definition, summary, item_map, hosts, host_ips, edges=None, bucket=None):
+    # One row per host with the definition's columns, from the shared fetch.
+    # With buckets the columns over the whole window are followed by the
+    # same columns for every bucket, titled "<title> (<bucket>)".
+    host_ids = [host["hostid"] for host in hosts]
+    report_map = {
+        (host_id, metric): item_ids
+        for (host_id, (report, metric)), item_ids in item_map.items() if report == definition.name
+    }
+    metrics = list(definition.keys)
+    percentiles = percentile_stats(definition)
+    stats = [*STATS, *percentiles]
+    aggregated = aggregate_by_metric(collapse_buckets(summary), report_map, definition.scale, percentiles).reindex(
+        index=host_ids, columns=pd.MultiIndex.from_product([stats, metrics])
+    )
+
+    df = pd.DataFrame({
+        "Host ID": host_ids,
+        "Hostname": [host["name"] for host in hosts],
+        "IP Address": [host_ips.get(host_id) for host_id in host_ids]
+    })
+    for column in definition.columns:
+        df[column["title"]] = aggregated[column["stat"], column["metric"]].to_numpy()
+
+    if edges:
+        columns = pd.MultiIndex.from_product([stats, metrics, edges])
+        if "bucket" in summary.index.names:
+            per_bucket = aggregate_by_metric(summary, report_map, definition.scale, percentiles).reindex(
+                index=host_ids, columns=columns
+            )
+        else:
+            per_bucket = pd.DataFrame(index=host_ids, columns=columns, dtype=float)
+        # Built separately and joined once; inserting hundreds of columns one by one fragments the frame
+        df = pd.concat([df, pd.DataFrame({
+            f"{column['title']} ({bucket_label(start, bucket)})":
+                per_bucket[column["stat"], column["metric"], start].to_numpy()
+            for start in edges for column in definition.columns
+        })], axis=1)
+    # Hosts without items or trend data are reported as empty cells
+    return df.astype(object).where(df.notna(), None)
+
+
+def _metadata(client, kind, key, fetch, check=None, signature=None):
+    # fetch() through the client's MetadataCache, if it has one; see
+    # MetadataCache.get() for check and signature. Keys are per server.
+    if client.metadata is None:
+        return fetch()
+    return client.metadata.get(kind, (client.url, key), fetch, check, signature)
+
+
+def fetch_hosts(client, definitions, hosts, time_from, time_till, args, metrics):
+    # IPs, items and per-item partial aggregates for a list of hosts.
+    # Returns (host_ips, item_map, searches, summary); searches holds the
+    # wildcard item.get results per search pattern for discovery.
+    host_ids = [host["hostid"] for host in hosts]
+    with metrics.stage("interfaces"):
+        # IPs have no cheap check; they are fetched again after their TTL
+        host_ips = _metadata(
+            client, "interfaces", host_ids, lambda: get_host_ips(client, host_ids, args.concurrency)
+        )
+
+    with metrics.stage("items") as stage:
+        keys = {
+            (definition.name, metric): key_list
+            for definition in definitions for metric, key_list in definition.keys.items()
+        }
+
+        def resolve_items():
+            value_types = {}
+            return get_item_map(client, host_ids, keys, args.concurrency, value_types), value_types
+
+        item_keys = sorted({key for key_list in keys.values() for key in key_list})
+        item_map, value_types = _metadata(
+            client, "items", ("keys", host_ids, sorted((list(metric), key_list) for metric, key_list in keys.items())),
+            resolve_items, lambda: list_item_ids(client, host_ids, item_keys, concurrency=args.concurrency),
+            lambda items: sorted(items[1])
+        )
+        # Copies, as discovery below adds to them
+        item_map = {metric: list(item_ids) for metric, item_ids in item_map.items()}
+        value_types = dict(value_types)
+
+        # One wildcard item.get per distinct search pattern covers every discovering report
+        searches = {}
+        for definition in definitions:
+            if definition.discover:
+                search = definition.discover["search"]
+                if search not in searches:
+                    searches[search] = _metadata(
+                        client, "items", ("search", host_ids, search),
+                        lambda: search_items(client, host_ids, search, args.concurrency),
+                        lambda: list_item_ids(client, host_ids, search=search, concurrency=args.concurrency),
+                        lambda items: sorted({item["itemid"] for item in items})
+                    )
+                    value_types.update((item["itemid"], item.get("value_type")) for item in searches[search])
+                discover_metrics(definition, searches[search], item_map)
+
+        item_ids = list(dict.fromkeys(item_id for item_ids in item_map.values() for item_id in item_ids))
+        stage["rows"] = len(item_ids)
+
+        # Quantile sketches are only built for the items behind percentile columns
+        sketched = {
+            (definition.name, column["metric"])
+            for definition in definitions for column in definition.columns if column["stat"] not in STATS
+        }
+        sketched_reports = {
+            definition.name for definition in definitions
+            if definition.discover and definition.discover.get("stat", "avg") not in STATS
+        }
+        sketch_items = {
+            item_id for (_, (report, metric)), metric_items in item_map.items()
+            if (report, metric) in sketched or report in sketched_reports for item_id in metric_items
+        }
+
+    with metrics.stage("fetch") as stage:
+        edges = bucket_starts(time_from, time_till, args.bucket) if args.bucket else None
+        summary = get_summary(
+            client, item_ids, value_types, time_from, time_till, args.concurrency, args.slice_days,
+            open_cache(args), args.stream, args.source, edges, open_rollups(args), sketch_items
+        )
+        stage["rows"] = len(summary)
+    return host_ips, item_map, searches, summary
+
+
+def _fetch_shard(url, options, auth_token, authorization, definitions, time_from, time_till, args, profile, shard):
+    # Runs in a worker process: its own client on the session of the parent.
+    # With --profile (profile is the parent's prefix) the stages of the
+    # shard are profiled to <prefix>-shard<N>-profile-<stage> files.
+    number, hosts = shard
+    client = ZabbixClient(url, **options)
+    client.auth_token = auth_token
+    if authorization:
+        client.session.headers["Authorization"] = authorization
+    client.metrics = Metrics(StageProfiler(f"{profile}-shard{number}") if profile else None)
+    client.metadata = open_metadata(args)
+    try:
+        result = fetch_hosts(client, definitions, hosts, time_from, time_till, args, client.metrics)
+        return result, client.metrics.calls, client.metrics.profiler.files if profile else []
+    finally:
+        client.close()
+
+
+def fetch_sharded(client, definitions, hosts, time_from, time_till, args, metrics):
+    # fetch_hosts() over contiguous shards of the hosts in a process pool, so
+    # JSON decoding and aggregation use several cores. Hosts never share
+    # items, so the shard results merge without overlap.
+    shard_size = -(-len(hosts) // args.workers)
+    shards = [hosts[start:start + shard_size] for start in range(0, len(hosts), shard_size)]
+    fetch = functools.partial(
+        _fetch_shard, client.url, client_options(args), client.auth_token,
+        client.session.headers.get("Authorization"), definitions, time_from, time_till, args,
+        metrics.profiler.prefix if metrics.profiler else None
+    )
+    host_ips, item_map, searches, partials = {}, {}, {}, []
+    with ProcessPoolExecutor(len(shards)) as pool:
+        for (shard_ips, shard_items, shard_searches, summary), calls, files in pool.map(fetch, enumerate(shards, 1)):
+            host_ips.update(shard_ips)
+            item_map.update(shard_items)
+            for search, items in shard_searches.items():
+                searches.setdefault(search, []).extend(items)
+            partials.append(summary)
+            metrics.absorb(calls)
+            if metrics.profiler:
+                metrics.profiler.files.extend(files)
+    return host_ips, item_map, searches, merge_partials(partials)
+
+
+def run_reports(client, definitions, group_input, time_from, time_till, args, metrics=None):
+    # Resolve hosts and items once for the union of all keys, fetch trends once
+    # and build every report from the shared data. Returns [(definition, df)].
+    # Each stage is timed in metrics. With --workers the hosts are split
+    # into shards fetched in parallel processes.
+    metrics = metrics or Metrics()
+    started = time.time()
+    with metrics.stage("groups") as stage:
+        hosts = _metadata(
+            client, "groups", group_input, lambda: get_hosts_from_groups(client, group_input),
+            lambda: list_group_hosts(client, group_input), host_signature
+        )
+        if not hosts:
+            return []
+        stage["rows"] = len(hosts)
+
+    if args.workers > 1 and len(hosts) > 1:
+        with metrics.stage("shards"):
+            host_ips, item_map, searches, summary = fetch_sharded(
+                client, definitions, hosts, time_from, time_till, args, metrics
+            )
+    else:
+        host_ips, item_map, searches, summary = fetch_hosts(
+            client, definitions, hosts, time_from, time_till, args, metrics
+        )
+    # The trend cache only evicts once every shard has summarized its rows
+    cache = open_cache(args)
+    if cache is not None:
+        cache.evict(started)
+
+    # Columns of discovering reports come from the items found on all hosts
+    definitions = [
+        discover_metrics(definition, searches[definition.discover["search"]], {}) if definition.discover
+        else definition
+        for definition in definitions
+    ]
+    with metrics.stage("aggregate") as stage:
+        edges = bucket_starts(time_from, time_till, args.bucket) if args.bucket else None
+        reports = [
+            (definition, build_report(definition, summary, item_map, hosts, host_ips, edges, args.bucket))
+            for definition in definitions
+        ]
+        stage["rows"] = sum(len(df) for _, df in reports)
+    return reports
+
+
+def connect(server, args):
+    # Pooled client for the server, authenticated; returns (client, keep_session)
+    client = ZabbixClient(server.url, **client_options(args))
+    client.metadata = open_metadata(args)
+    keep_session = authenticate(
+        client, server.username, server.password, server.api_token, None if args.logout else args.session_file
+    )
+    return client, keep_session
+
+
+def run_server(server, definitions, group_input, time_from, time_till, args, metrics, client=None):
+    # Run the reports on one server. Without a client one is connected for
+    # this run and closed again, logging out unless the session is kept.
+    if client is not None:
+        client.metrics = metrics
+        return run_reports(client, definitions, group_input, time_from, time_till, args, metrics)
+    client, keep_session = connect(server, args)
+    client.metrics = metrics
+    try:
+        return run_reports(client, definitions, group_input, time_from, time_till, args, metrics)
+    finally:
+        if not keep_session:
+            client.logout()
+        client.close()
+
+
+def server_args(args, server):
+    # The trend cache and the rollups are kept per server URL anyway;
+    # separate files keep servers running at the same time from waiting on
+    # each other's write locks.
+    args = copy.copy(args)
+    args.rollups = _server_path(args.rollups, server.name)
+    if args.cache:
+        args.cache = _server_path(args.cache, server.name)
+    return args
+
+
+def _server_path(path, name):
+    root, extension = os.path.splitext(path)
+    return f"{root}-{name}{extension}"
+
+
+def run_federated(servers, definitions, group_input, time_from, time_till, args, metrics, clients=None):
+    # run_server() on every server at the same time, so the run takes as
+    # long as the slowest server. clients optionally maps server names to
+    # connected clients. API calls and the stages of each server (as
+    # "<server>:<stage>") are added to metrics. Returns the merged
+    # [(definition, df)].
+    def run(server):
+        server_metrics = Metrics()
+        reports = run_server(
+            server, definitions, group_input, time_from, time_till, server_args(args, server), server_metrics,
+            (clients or {}).get(server.name)
+        )
+        metrics.absorb(server_metrics.calls, {
+            f"{server.name}:{name}": stage for name, stage in server_metrics.stages.items()
+        })
+        return reports
+
+    with metrics.stage("servers"):
+        with ThreadPoolExecutor(len(servers)) as pool:
+            results = list(pool.map(run, servers))
+    return merge_server_reports(definitions, servers, results)
+
+
+def merge_server_reports(definitions, servers, results):
+    # One report per definition with the rows of every server, in server
+    # order, tagged with the server name in a leading column. Discovered
+    # columns can differ between servers; the merged report has all of
+    # them and leaves the cells of servers without them empty.
+    merged = {}
+    for server, reports in zip(servers, results):
+        for definition, df in reports:
+            df = df.copy()
+            df.insert(0, SERVER_COLUMN, server.name)
+            merged.setdefault(definition.name, (definition, []))[1].append(df)
+
+    reports = []
+    for definition in definitions:
+        if definition.name in merged:
+            expanded, frames = merged[definition.name]
+            df = pd.concat(frames, ignore_index=True, sort=False)
+            reports.append((expanded, df.astype(object).where(df.notna(), None)))
+    return reports
+
+
+def _in_output_dir(args, path):
+    return os.path.join(args.output_dir, path) if args.output_dir else path
+
+
+def write_reports(reports, metadata, args):
+    if getattr(args, "workbook", None):
+        report_file = _in_output_dir(args, args.workbook)
+        write_workbook(report_file, [
+            (definition.name, metadata, df.columns, df.itertuples(index=False, name=None))
+            for definition, df in reports
+        ])
+        print(f"Report saved as '{report_file}'.")
+        return
+
+    # Stream the rows to the report files, keeping the metadata header at the top
+    for definition, df in reports:
+        report_file = _in_output_dir(args, output_path(definition.output, args.format))
+        write_report(
+            report_file, args.format, definition.sheet, metadata, df.columns, df.itertuples(index=False, name=None),
+            [SERVER_COLUMN, *HOST_COLUMNS]
+        )
+        print(f"Report saved as '{report_file}'.")
+
+
+def profile_prefix(definitions, args):
+    # Profiles go next to the report: the workbook or the single report file,
+    # "Reports" when several report files are written
+    if getattr(args, "workbook", None):
+        report_file = args.workbook
+    elif len(definitions) == 1:
+        report_file = output_path(definitions[0].output, args.format)
+    else:
+        report_file = "Reports"
+    return _in_output_dir(args, os.path.splitext(report_file)[0])
+
+
+def default_server():
+    # The server of ZABBIX_URL and the credentials above, used without --servers
+    return ZabbixServer(None, ZABBIX_URL, USERNAME, PASSWORD, API_TOKEN)
+
+
+def report_window(start_date, end_date, now=None):
+    # (time_from, time_till, metadata header) for YYYY-MM-DD dates. The end
+    # date is included up to its last second, or up to now if that is
+    # earlier (a report ending today covers today so far).
+    start_datetime = datetime.strptime(start_date, "%Y-%m-%d")
+    end_datetime = datetime.strptime(end_date, "%Y-%m-%d")
+    time_from = int(start_datetime.timestamp())
+    time_till = int((end_datetime + timedelta(days=1)).timestamp()) - 1
+    time_till = min(time_till, int(time.time() if now is None else now))
+    total_days = (end_datetime - start_datetime).days + 1  # Inclusive of start and end dates
+    return time_from, time_till, [("Start Date", start_date), ("End Date", end_date), ("Total Days", total_days)]
+
+
+def collect_reports(definitions, servers, group_input, start_date, end_date, args, clients=None):
+    # Run the definitions on the server (or with --servers on all servers)
+    # for the dates. clients optionally maps server names to connected
+    # clients kept between runs. Returns (reports, metadata, metrics).
+    time_from, time_till, metadata = report_window(start_date, end_date)
+    metrics = Metrics(StageProfiler(profile_prefix(definitions, args)) if args.profile else None)
+    if args.servers:
+        reports = run_federated(servers, definitions, group_input, time_from, time_till, args, metrics, clients)
+        metadata.append(("Servers", ", ".join(server.name for server in servers)))
+    else:
+        reports = run_server(
+            servers[0], definitions, group_input, time_from, time_till, args, metrics,
+            (clients or {}).get(servers[0].name)
+        )
+    return reports, metadata, metrics
+
+
+def save_reports(reports, metadata, metrics, definitions, args, labels=None):
+    # Write the reports, print the timings and write the metrics files
+    with metrics.stage("write") as stage:
+        write_reports(reports, metadata, args)
+        stage["rows"] = sum(len(df) for _, df in reports)
+
+    print(metrics.stage_line())
+    if metrics.profiler:
+        print(f"Profiles saved as {', '.join(metrics.profiler.files)}.")
+    if args.metrics:
+        metrics.write_json(args.metrics)
+    if args.prometheus:
+        metrics.write_prometheus(args.prometheus, {
+            **(labels or {}), "report": ",".join(definition.name for definition in definitions)
+        })
+
+
+def main(report_names=None, description=None):
+    # Entry point of the task_report_* scripts. Without report_names the reports
+    # are taken from --report (default: every definition in reports/).
+    def add_arguments(parser):
+        if report_names is None:
+            parser.add_argument(
+                "--report", action="append", choices=available_reports(),
+                help="report definition to run; repeat for several (default: all)"
+            )
+            parser.add_argument(
+                "--workbook", metavar="FILE",
+                help="write all reports as sheets of one Excel workbook instead of one file each (xlsx only)"
+            )
+
+    args = parse_args(description or "Zabbix trend reports", add_arguments)
+    definitions = [load_definition(name) for name in report_names or args.report or available_reports()]
+    servers = load_servers(args.servers) if args.servers else [default_server()]
+
+    group_input = input("Enter host group names or IDs separated by commas: ").split(",")
+    group_input = [group.strip() for group in group_input]
+    start_date = input("Enter start date (YYYY-MM-DD): ")
+    end_date = input("Enter end date (YYYY-MM-DD): ")
+
+    # Authenticate once per server and reuse the pooled client for every call
+    reports, metadata, metrics = collect_reports(definitions, servers, group_input, start_date, end_date, args)
+    if not reports:
+        print("No hosts found in the specified host groups.")
+        return
+
+    for definition, df in reports:
+        print(df)
+    save_reports(reports, metadata, metrics, definitions, args)
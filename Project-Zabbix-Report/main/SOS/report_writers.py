@@ -0,0 +1,157 @@
+import csv
+import math
+import os
+from contextlib import contextmanager
+
+from openpyxl import Workbook
+
+# Streaming report writers. Every writer takes the metadata header
+# (Start Date / End Date / Total Days), the names of the text columns, the
+# column names and an iterable of rows, and writes rows as they are produced instead of building the whole
+# report in memory first. Reports are written to a temporary file that
+# replaces the target only when complete, so a reader (or a crash) never
+# sees a half-written report.
+
+# Rows buffered per Parquet row group
+PARQUET_BATCH_SIZE = 10000
+
+FORMAT_EXTENSIONS = {"xlsx": ".xlsx", "csv": ".csv", "parquet": ".parquet"}
+
+
+def _clean(value):
+    # Empty cells for missing aggregates; plain Python scalars for the writers
+    if value is None:
+        return None
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+class ExcelReportWriter:
+    # Write-only openpyxl workbook: rows go straight to the sheet XML stream
+    # instead of being kept as cell objects
+    def __init__(self, path, sheet_title, metadata, text_columns=()):
+        self.path = path
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet(title=sheet_title)
+        for name, value in metadata:
+            self.sheet.append([name, value])
+        self.sheet.append([])  # Blank row to separate metadata from the table
+
+    def write_rows(self, columns, rows):
+        self.sheet.append(list(columns))
+        for row in rows:
+            self.sheet.append([_clean(value) for value in row])
+
+    def close(self):
+        self.workbook.save(self.path)
+
+
+class CSVReportWriter:
+    # Same layout as the Excel sheet: metadata rows, a blank line, then the table
+    def __init__(self, path, sheet_title, metadata, text_columns=()):
+        self.path = path
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        for name, value in metadata:
+            self.writer.writerow([name, value])
+        self.writer.writerow([])
+
+    def write_rows(self, columns, rows):
+        self.writer.writerow(list(columns))
+        for row in rows:
+            self.writer.writerow([_clean(value) for value in row])
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetReportWriter:
+    # Rows are written in row groups of PARQUET_BATCH_SIZE; the metadata header
+    # is stored as key/value metadata in the file schema. The text columns
+    # are strings and all others float64, whatever the first rows hold (a
+    # column can be empty for thousands of hosts). Requires pyarrow.
+    def __init__(self, path, sheet_title, metadata, text_columns=()):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise RuntimeError("Parquet output requires the pyarrow package (pip install pyarrow)") from e
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.path = path
+        self.metadata = {"sheet": sheet_title, **{name: str(value) for name, value in metadata}}
+        self.text_columns = set(text_columns)
+        self.writer = None
+
+    def _schema(self, columns):
+        return self.pa.schema(
+            [(column, self.pa.string() if column in self.text_columns else self.pa.float64()) for column in columns],
+            metadata=self.metadata
+        )
+
+    def _write_batch(self, columns, batch):
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, self._schema(columns))
+        table = self.pa.Table.from_pylist([dict(zip(columns, row)) for row in batch], schema=self.writer.schema)
+        self.writer.write_table(table)
+
+    def write_rows(self, columns, rows):
+        columns = list(columns)
+        batch = []
+        for row in rows:
+            batch.append([_clean(value) for value in row])
+            if len(batch) >= PARQUET_BATCH_SIZE:
+                self._write_batch(columns, batch)
+                batch = []
+        if batch or self.writer is None:
+            self._write_batch(columns, batch)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+WRITERS = {"xlsx": ExcelReportWriter, "csv": CSVReportWriter, "parquet": ParquetReportWriter}
+
+
+def output_path(report_file, fmt):
+    # Swap the default .xlsx file name for the extension of the chosen format
+    return os.path.splitext(report_file)[0] + FORMAT_EXTENSIONS[fmt]
+
+
+@contextmanager
+def _atomic_path(path):
+    # Yields a temporary path next to `path` and renames it into place on success
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_report(report_file, fmt, sheet_title, metadata, columns, rows, text_columns=()):
+    with _atomic_path(report_file) as tmp_path:
+        writer = WRITERS[fmt](tmp_path, sheet_title, metadata, text_columns)
+        writer.write_rows(columns, rows)
+        writer.close()
+
+
+def write_workbook(report_file, sheets):
+    # Several reports as sheets of one write-only workbook;
+    # sheets is a list of (title, metadata, columns, rows)
+    workbook = Workbook(write_only=True)
+    for title, metadata, columns, rows in sheets:
+        sheet = workbook.create_sheet(title=title)
+        for name, value in metadata:
+            sheet.append([name, value])
+        sheet.append([])
+        sheet.append(list(columns))
+        for row in rows:
+            sheet.append([_clean(value) for value in row])
+    with _atomic_path(report_file) as tmp_path:
+        workbook.save(tmp_path)
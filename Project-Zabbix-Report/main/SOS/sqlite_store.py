@@ -0,0 +1,22 @@
+import sqlite3
+
+# Helpers shared by the local SQLite stores: the trend cache, the daily
+# rollups and the metadata cache.
+
+# Seconds a connection waits for another process's write lock
+LOCK_TIMEOUT = 60
+
+# Number of SQL parameters bound per IN (...) query
+SQL_BATCH_SIZE = 500
+
+
+def connect(path):
+    # Worker processes (--workers) share the file, so a connection waits for
+    # their locks. Stores are kept open between runs (report_daemon.py),
+    # which may use other threads.
+    return sqlite3.connect(path, timeout=LOCK_TIMEOUT, check_same_thread=False)
+
+
+def chunks(values, size=SQL_BATCH_SIZE):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
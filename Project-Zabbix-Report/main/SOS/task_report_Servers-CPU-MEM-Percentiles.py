@@ -0,0 +1,6 @@
+from report_engine import load_definition, main
+
+# Keys, columns, scaling and output file are defined in reports/Servers-CPU-MEM-Percentiles.toml
+
+if __name__ == "__main__":
+    main(["Servers-CPU-MEM-Percentiles"], load_definition("Servers-CPU-MEM-Percentiles").description)
@@ -0,0 +1,9 @@
+from report_engine import main
+
+# Runs several report definitions from reports/ in one pass: one login, one
+# host/item resolution and one trend fetch shared by every report.
+# Select reports with --report (default: all) and use --workbook FILE to get
+# them as sheets of a single workbook.
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import bisect
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from quantile_sketch import QuantileSketch, bin_index, build_sketches
+
+# Mergeable trend aggregates shared by the report scripts.
+# Trend rows are reduced per itemid to partial aggregates: min of value_min,
+# max of value_max, sum of value_avg * num and sum of num. Weighting by num
+# (the number of values behind each hourly row) keeps hours with partial
+# samples from skewing the average. Partials from different time slices or
+# batches merge into the same numbers a single pass over all rows would give.
+# Given bucket edges (see bucket_starts) the partials are kept per
+# (itemid, bucket) instead, and collapse_buckets() folds them into the total.
+# For the items in sketch_items the partials also carry a "sketch" column, a
+# QuantileSketch of the values behind them (hourly value_avg weighted by num
+# for trends, every value for history) that percentile columns are read from.
+
+PARTIAL_COLUMNS = ["min", "max", "sum", "count"]
+
+BUCKET_LABELS = {"day": "%Y-%m-%d", "week": "%G-W%V", "month": "%Y-%m"}
+
+
+def empty_partials():
+    return pd.DataFrame(columns=PARTIAL_COLUMNS, index=pd.Index([], name="itemid"), dtype=float)
+
+
+def bucket_starts(time_from, time_till, bucket):
+    # Local-time start of every day, ISO week (from Monday) or month
+    # overlapping [time_from, time_till]
+    start = datetime.fromtimestamp(time_from).replace(hour=0, minute=0, second=0, microsecond=0)
+    if bucket == "week":
+        start -= timedelta(days=start.weekday())
+    elif bucket == "month":
+        start = start.replace(day=1)
+    starts = []
+    while start.timestamp() <= time_till:
+        starts.append(int(start.timestamp()))
+        if bucket == "month":
+            start = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+        else:
+            start += timedelta(days=7 if bucket == "week" else 1)
+    return starts
+
+
+def bucket_label(start, bucket):
+    return datetime.fromtimestamp(start).strftime(BUCKET_LABELS[bucket])
+
+
+def _partials_frame(keys, mins, maxs, sums, counts, edges=None, sketches=None):
+    # keys are itemids, or itemid * len(edges) + bucket index with edges;
+    # sketches maps keys to their QuantileSketch
+    if edges is None:
+        index = pd.Index(keys.astype(str), name="itemid")
+    else:
+        item_ids, buckets = np.divmod(keys, len(edges))
+        index = pd.MultiIndex.from_arrays(
+            [item_ids.astype(str), np.asarray(edges, dtype=np.int64)[buckets]], names=["itemid", "bucket"]
+        )
+    frame = pd.DataFrame({"min": mins, "max": maxs, "sum": sums, "count": counts}, index=index)
+    if sketches is not None:
+        frame["sketch"] = [sketches.get(int(key)) for key in keys]
+    return frame
+
+
+def _sketches(keys, item_ids, values, weights, sketch_items):
+    # Sketches per reduction key of the rows whose item is in sketch_items
+    if not sketch_items:
+        return None
+    rows = np.isin(item_ids, np.array([int(item_id) for item_id in sketch_items], dtype=np.int64))
+    return build_sketches(keys[rows], values[rows], weights[rows])
+
+
+def _group_keys(item_ids, clocks, edges):
+    # Reduction keys: the itemid, or the itemid combined with the bucket of
+    # each row's clock so one kernel pass yields every bucket
+    if edges is None:
+        return item_ids
+    buckets = np.searchsorted(np.asarray(edges, dtype=np.int64), clocks, side="right") - 1
+    return item_ids * len(edges) + np.clip(buckets, 0, len(edges) - 1)
+
+
+def aggregate_arrays(item_ids, value_min, value_avg, value_max, num):
+    # Vectorized kernel over contiguous int64/float64 arrays: sort once by
+    # itemid, then reduce every run of equal ids in a single pass
+    order = np.argsort(item_ids, kind="stable")
+    item_ids = item_ids[order]
+    starts = np.flatnonzero(np.concatenate(([True], item_ids[1:] != item_ids[:-1])))
+    weights = num[order]
+    return (
+        item_ids[starts],
+        np.minimum.reduceat(value_min[order], starts),
+        np.maximum.reduceat(value_max[order], starts),
+        np.add.reduceat(value_avg[order] * weights, starts),
+        np.add.reduceat(weights, starts)
+    )
+
+
+def summarize_trends(trend_data, edges=None, sketch_items=None):
+    # Reduce raw trend.get rows to one partial aggregate per itemid (and bucket)
+    if not trend_data:
+        return empty_partials()
+    item_ids = np.array([row["itemid"] for row in trend_data], dtype=np.int64)
+    keys = _group_keys(item_ids, np.array([row["clock"] for row in trend_data], dtype=np.int64), edges)
+    value_avg = np.array([row["value_avg"] for row in trend_data], dtype=np.float64)
+    num = np.array([row["num"] for row in trend_data], dtype=np.float64)
+    return _partials_frame(*aggregate_arrays(
+        keys,
+        np.array([row["value_min"] for row in trend_data], dtype=np.float64),
+        value_avg,
+        np.array([row["value_max"] for row in trend_data], dtype=np.float64),
+        num
+    ), edges=edges, sketches=_sketches(keys, item_ids, value_avg, num, sketch_items))
+
+
+def summarize_history(history_data, edges=None, sketch_items=None):
+    # Raw history.get values as partials: every value counts once, so the
+    # results merge with trend partials (where num counts the values per hour)
+    if not history_data:
+        return empty_partials()
+    values = np.array([row["value"] for row in history_data], dtype=np.float64)
+    item_ids = np.array([row["itemid"] for row in history_data], dtype=np.int64)
+    keys = _group_keys(item_ids, np.array([row["clock"] for row in history_data], dtype=np.int64), edges)
+    weights = np.ones(len(values))
+    return _partials_frame(
+        *aggregate_arrays(keys, values, values, values, weights), edges=edges,
+        sketches=_sketches(keys, item_ids, values, weights, sketch_items)
+    )
+
+
+def accumulate_trends(trend_rows, edges=None, sketch_items=None):
+    # Fold trend rows one at a time into running per-item aggregates.
+    # Works on any iterable, so a streamed response is never materialized;
+    # sketches are kept as {bin index: weight}, bounded by the bins in use.
+    totals = {}
+    bins = {}
+    for row in trend_rows:
+        key = row["itemid"]
+        if edges is not None:
+            key = (key, edges[max(0, bisect.bisect_right(edges, int(row["clock"])) - 1)])
+        value_min = float(row["value_min"])
+        value_max = float(row["value_max"])
+        num = float(row["num"])
+        weighted_avg = float(row["value_avg"]) * num
+        if sketch_items and row["itemid"] in sketch_items:
+            item_bins = bins.setdefault(key, {})
+            index = bin_index(float(row["value_avg"]))
+            item_bins[index] = item_bins.get(index, 0.0) + num
+        total = totals.get(key)
+        if total is None:
+            totals[key] = [value_min, value_max, weighted_avg, num]
+            continue
+        if value_min < total[0]:
+            total[0] = value_min
+        if value_max > total[1]:
+            total[1] = value_max
+        total[2] += weighted_avg
+        total[3] += num
+    if not totals:
+        return empty_partials()
+    if edges is None:
+        frame = pd.DataFrame.from_dict(totals, orient="index", columns=PARTIAL_COLUMNS).rename_axis("itemid")
+    else:
+        frame = pd.DataFrame(
+            list(totals.values()), columns=PARTIAL_COLUMNS,
+            index=pd.MultiIndex.from_tuples(list(totals), names=["itemid", "bucket"])
+        )
+    if sketch_items:
+        frame["sketch"] = [QuantileSketch.from_bins(bins[key]) if key in bins else None for key in totals]
+    return frame
+
+
+def with_sketches(partials, sketches):
+    # Partials indexed by itemid with a sketch column from {itemid: sketch}
+    partials = partials.copy()
+    partials["sketch"] = [sketches.get(item_id) for item_id in partials.index]
+    return partials
+
+
+def _aggregations(partials):
+    aggregations = {"min": "min", "max": "max", "sum": "sum", "count": "sum"}
+    if "sketch" in partials.columns:
+        aggregations["sketch"] = QuantileSketch.merge
+    return aggregations
+
+
+def merge_partials(partials):
+    # Combine partial aggregates of the same items (and buckets) computed over different slices
+    partials = [partial for partial in partials if not partial.empty]
+    if not partials:
+        return empty_partials()
+    if len(partials) == 1:
+        return partials[0]
+    combined = pd.concat(partials)
+    return combined.groupby(level=partials[0].index.names).agg(_aggregations(combined))
+
+
+def collapse_buckets(partials):
+    # Per-bucket partials folded into one partial per itemid over the whole window
+    if "bucket" not in partials.index.names:
+        return partials
+    return partials.groupby(level="itemid").agg(_aggregations(partials))
+
+
+def aggregate_by_metric(partials, item_map, scale=1, percentiles=()):
+    # Fold the per-item partials of every (host, metric) pair into min/avg/max
+    # and the given percentile stats ("p95"), multiply by scale (unit
+    # conversion) and pivot to one row per host with a (stat, metric) column
+    # per aggregate, or (stat, metric, bucket) for per-bucket partials
+    owners = pd.DataFrame(
+        [(item_id, host_id, metric) for (host_id, metric), item_ids in item_map.items() for item_id in item_ids],
+        columns=["itemid", "hostid", "metric"]
+    )
+    levels = ["metric", *partials.index.names[1:]]
+    df = owners.merge(partials.reset_index(), on="itemid")
+    grouped = df.groupby(["hostid", *levels]).agg(_aggregations(df))
+    aggregated = pd.DataFrame({
+        "min": grouped["min"] * scale,
+        "avg": grouped["sum"] / grouped["count"] * scale,
+        "max": grouped["max"] * scale
+    })
+    for stat in percentiles:
+        rank = float(stat[1:]) / 100
+        aggregated[stat] = grouped["sketch"].map(
+            lambda sketch: sketch.quantile(rank) * scale if isinstance(sketch, QuantileSketch) else np.nan
+        ) if "sketch" in grouped.columns else np.nan
+    return aggregated.unstack(levels)
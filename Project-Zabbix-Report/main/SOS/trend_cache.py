@@ -0,0 +1,241 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from quantile_sketch import build_sketches
+from sqlite_store import chunks, connect
+from trend_aggregate import PARTIAL_COLUMNS, empty_partials, with_sketches
+
+# Persistent SQLite cache of hourly trend rows.
+# Rows are keyed by (itemid, clock). A separate table records which
+# (itemid, time range) spans have already been fetched, so later runs only
+# call trend.get for the gaps. Only closed hours are cached: the current
+# hour is still being aggregated by the Zabbix server and is always fetched
+# fresh. Item IDs are only unique within one Zabbix server, so rows are
+# stored under the server's URL, as a small number from the servers table.
+# Once a run's summaries are done, the least recently used items are
+# evicted until the cache holds at most max_rows rows (see evict()).
+
+HOUR_SECONDS = 3600
+
+# Time the server is given to write an hour's trends after the hour closes
+TREND_SETTLE_SECONDS = 600
+
+# Default size cap, roughly 1 GB on disk
+DEFAULT_MAX_ROWS = 20_000_000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS servers (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS trends (
+    server INTEGER NOT NULL,
+    itemid INTEGER NOT NULL,
+    clock INTEGER NOT NULL,
+    num INTEGER,
+    value_min REAL,
+    value_avg REAL,
+    value_max REAL,
+    PRIMARY KEY (server, itemid, clock)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS spans (
+    server INTEGER NOT NULL,
+    itemid INTEGER NOT NULL,
+    span_from INTEGER NOT NULL,
+    span_till INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS spans_item ON spans (server, itemid, span_from);
+CREATE TABLE IF NOT EXISTS items (
+    server INTEGER NOT NULL,
+    itemid INTEGER NOT NULL,
+    rows INTEGER NOT NULL DEFAULT 0,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (server, itemid)
+);
+"""
+
+
+def closed_until(now=None):
+    # Last second of the most recent hour whose trends are final
+    now = time.time() if now is None else now
+    return int((now - TREND_SETTLE_SECONDS) // HOUR_SECONDS) * HOUR_SECONDS - 1
+
+
+class TrendCache:
+    def __init__(self, path, max_rows=DEFAULT_MAX_ROWS):
+        self.path = path
+        self.max_rows = max_rows
+        self.db = connect(path)
+        # Rows cached before they were kept per server cannot be told apart
+        # by server, so they are dropped and fetched again
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(trends)")}
+        if columns and "server" not in columns:
+            self.db.executescript("DROP TABLE trends; DROP TABLE IF EXISTS spans; DROP TABLE IF EXISTS items;")
+        self.db.executescript(_SCHEMA)
+        self.server_ids = {}
+
+    def _server_id(self, server):
+        # Number standing for the server URL in the other tables
+        if server not in self.server_ids:
+            with self.db:
+                self.db.execute("INSERT OR IGNORE INTO servers (url) VALUES (?)", (server,))
+            self.server_ids[server] = self.db.execute(
+                "SELECT id FROM servers WHERE url = ?", (server,)
+            ).fetchone()[0]
+        return self.server_ids[server]
+
+    def missing_spans(self, server, item_id, time_from, time_till):
+        # Sub-ranges of [time_from, time_till] not yet fetched for this item
+        # of the server (its API URL)
+        spans = self.db.execute(
+            "SELECT span_from, span_till FROM spans WHERE server = ? AND itemid = ? AND span_till >= ?"
+            " AND span_from <= ? ORDER BY span_from",
+            (self._server_id(server), int(item_id), time_from, time_till)
+        ).fetchall()
+        gaps = []
+        cursor = time_from
+        for span_from, span_till in spans:
+            if span_from > cursor:
+                gaps.append((cursor, span_from - 1))
+            cursor = max(cursor, span_till + 1)
+        if cursor <= time_till:
+            gaps.append((cursor, time_till))
+        return gaps
+
+    def store(self, server, trend_data, item_ids, time_from, time_till):
+        # Save fetched rows and mark [time_from, time_till] as covered for every
+        # requested item, including items that returned no rows. Nothing is
+        # evicted here: the rows are still needed by the run's summarize().
+        server = self._server_id(server)
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO trends VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((server, int(row["itemid"]), int(row["clock"]), int(row["num"]), float(row["value_min"]),
+                  float(row["value_avg"]), float(row["value_max"])) for row in trend_data)
+            )
+            for item_id in item_ids:
+                self._mark_covered(server, int(item_id), time_from, time_till)
+            self._touch(server, item_ids, count_rows=True)
+
+    def _mark_covered(self, server, item_id, time_from, time_till):
+        # Merge the new span with any overlapping or adjacent ones
+        overlapping = self.db.execute(
+            "SELECT span_from, span_till FROM spans WHERE server = ? AND itemid = ? AND span_till >= ?"
+            " AND span_from <= ?",
+            (server, item_id, time_from - 1, time_till + 1)
+        ).fetchall()
+        for span_from, span_till in overlapping:
+            time_from = min(time_from, span_from)
+            time_till = max(time_till, span_till)
+        self.db.execute(
+            "DELETE FROM spans WHERE server = ? AND itemid = ? AND span_till >= ? AND span_from <= ?",
+            (server, item_id, time_from, time_till)
+        )
+        self.db.execute("INSERT INTO spans VALUES (?, ?, ?, ?)", (server, item_id, time_from, time_till))
+
+    def _touch(self, server, item_ids, count_rows=False):
+        now = time.time()
+        for chunk in chunks([int(item_id) for item_id in item_ids]):
+            self.db.executemany(
+                "INSERT INTO items (server, itemid, last_used) VALUES (?, ?, ?)"
+                " ON CONFLICT (server, itemid) DO UPDATE SET last_used = excluded.last_used",
+                ((server, item_id, now) for item_id in chunk)
+            )
+            if count_rows:
+                placeholders = ",".join("?" * len(chunk))
+                self.db.execute(
+                    "UPDATE items SET rows = (SELECT COUNT(*) FROM trends"
+                    " WHERE trends.server = items.server AND trends.itemid = items.itemid)"
+                    f" WHERE server = ? AND itemid IN ({placeholders})",
+                    [server, *chunk]
+                )
+
+    def summarize(self, server, item_ids, time_from, time_till, edges=None, sketch_items=None):
+        # Per-item partial aggregates (num-weighted, as in trend_aggregate) of
+        # the cached rows, computed inside SQLite; with bucket edges one
+        # query per bucket, indexed by (itemid, bucket). Sketches for the
+        # items in sketch_items are built from their cached rows.
+        if edges is not None:
+            return self._summarize_buckets(server, item_ids, time_from, time_till, edges, sketch_items)
+        server_id = self._server_id(server)
+        frames = []
+        for chunk in chunks([int(item_id) for item_id in item_ids]):
+            placeholders = ",".join("?" * len(chunk))
+            frames.append(pd.read_sql_query(
+                "SELECT CAST(itemid AS TEXT) AS itemid, MIN(value_min) AS min, MAX(value_max) AS max,"
+                " SUM(value_avg * num) AS sum, SUM(num) AS count FROM trends"
+                f" WHERE server = ? AND itemid IN ({placeholders}) AND clock BETWEEN ? AND ? GROUP BY itemid",
+                self.db, params=[server_id, *chunk, time_from, time_till], index_col="itemid"
+            ))
+        with self.db:
+            self._touch(server_id, item_ids)
+        frames = [frame for frame in frames if not frame.empty]
+        partials = pd.concat(frames)[PARTIAL_COLUMNS] if frames else empty_partials()
+        if sketch_items:
+            partials = with_sketches(partials, self._sketches(server_id, sketch_items, time_from, time_till))
+        return partials
+
+    def _sketches(self, server, item_ids, time_from, time_till):
+        # {itemid: QuantileSketch} of the cached value_avg rows, weighted by
+        # num; one batch of items is read at a time
+        sketches = {}
+        for chunk in chunks([int(item_id) for item_id in item_ids]):
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.db.execute(
+                "SELECT itemid, value_avg, num FROM trends"
+                f" WHERE server = ? AND itemid IN ({placeholders}) AND clock BETWEEN ? AND ?",
+                [server, *chunk, time_from, time_till]
+            ).fetchall()
+            if not rows:
+                continue
+            ids, values, weights = zip(*rows)
+            sketches.update(
+                (str(item_id), sketch) for item_id, sketch in build_sketches(
+                    np.array(ids, dtype=np.int64), np.array(values, dtype=np.float64),
+                    np.array(weights, dtype=np.float64)
+                ).items()
+            )
+        return sketches
+
+    def _summarize_buckets(self, server, item_ids, time_from, time_till, edges, sketch_items=None):
+        frames = []
+        for start, end in zip(edges, [*edges[1:], time_till + 1]):
+            if end <= time_from or start > time_till:
+                continue
+            frame = self.summarize(
+                server, item_ids, max(time_from, start), min(time_till, end - 1), sketch_items=sketch_items
+            )
+            if not frame.empty:
+                frames.append(frame.assign(bucket=start).set_index("bucket", append=True))
+        return pd.concat(frames) if frames else empty_partials()
+
+    def evict(self, keep_since):
+        # Drop the least recently used items until the cache fits in max_rows.
+        # Called once a run's summaries are done; items used at or after
+        # keep_since (the start of the run) are kept, as other workers or
+        # runs on the same file may not have summarized them yet. The cache
+        # can therefore stay above max_rows until a later run.
+        total = self.db.execute("SELECT COALESCE(SUM(rows), 0) FROM items").fetchone()[0]
+        if total <= self.max_rows:
+            return
+        victims = {}
+        for server, item_id, rows in self.db.execute(
+            "SELECT server, itemid, rows FROM items WHERE last_used < ? ORDER BY last_used", (keep_since,)
+        ):
+            if total <= self.max_rows:
+                break
+            victims.setdefault(server, []).append(item_id)
+            total -= rows
+        with self.db:
+            for server, item_ids in victims.items():
+                for chunk in chunks(item_ids):
+                    placeholders = ",".join("?" * len(chunk))
+                    for table in ("trends", "spans", "items"):
+                        self.db.execute(
+                            f"DELETE FROM {table} WHERE server = ? AND itemid IN ({placeholders})", [server, *chunk]
+                        )
+
+    def close(self):
+        self.db.close()
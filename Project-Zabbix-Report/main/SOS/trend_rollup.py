@@ -0,0 +1,181 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from quantile_sketch import QuantileSketch
+from sqlite_store import chunks, connect
+from trend_aggregate import PARTIAL_COLUMNS, empty_partials, with_sketches
+
+# Local store of per-item daily rollups: min, max, sum of value_avg * num and
+# count (sum of num) for every whole local day, the same mergeable partials
+# trend_aggregate works with. A window made of whole days is answered by
+# adding up rollups; trend.get is only called for days not rolled up yet.
+# Only days whose last hour has closed are stored. A day on which an item
+# had no data is stored with count 0 so it is not fetched again.
+# Trends can reach the server late (e.g. from a proxy with a backlog), so a
+# rollup stored less than RECHECK_SECONDS after the end of its day is only
+# provisional: every later run fetches the day again until one stores it
+# after that delay.
+# Items behind percentile columns also keep a quantile sketch per day, in a
+# table of their own; a day of such an item without a sketch is fetched again.
+# Item IDs are only unique within one Zabbix server, so every rollup is
+# stored under the URL of the server it came from.
+
+DEFAULT_ROLLUP_FILE = os.path.join(os.path.expanduser("~"), ".zabbix_report_rollups.sqlite")
+
+# Seconds after the end of a day before its rollup is final
+RECHECK_SECONDS = 86400
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS daily (
+    server TEXT NOT NULL,
+    itemid INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    min REAL,
+    max REAL,
+    sum REAL NOT NULL,
+    count REAL NOT NULL,
+    final INTEGER NOT NULL,
+    PRIMARY KEY (server, itemid, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS daily_sketches (
+    server TEXT NOT NULL,
+    itemid INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    indexes BLOB NOT NULL,
+    weights BLOB NOT NULL,
+    PRIMARY KEY (server, itemid, day)
+) WITHOUT ROWID;
+"""
+
+
+class DailyRollups:
+    def __init__(self, path=DEFAULT_ROLLUP_FILE):
+        self.path = path
+        self.db = connect(path)
+        # Rollups stored before they were kept per server cannot be told
+        # apart by server, so they are dropped and fetched again
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(daily)")}
+        if columns and "server" not in columns:
+            self.db.executescript("DROP TABLE daily; DROP TABLE IF EXISTS daily_sketches;")
+        elif columns and "final" not in columns:
+            # Rollups stored before the re-check are checked once more
+            self.db.execute("ALTER TABLE daily ADD COLUMN final INTEGER NOT NULL DEFAULT 0")
+        self.db.executescript(_SCHEMA)
+
+    def missing_days(self, server, item_ids, days, sketch_items=None):
+        # {itemid: [day starts without a final rollup]} for the given local
+        # midnights on the server (its API URL); items in sketch_items also
+        # need the day's sketch
+        stored = self._stored_days("daily", server, item_ids, days, " AND final = 1")
+        if sketch_items:
+            sketched = self._stored_days(
+                "daily_sketches", server, [item_id for item_id in item_ids if item_id in sketch_items], days
+            )
+            stored = {key for key in stored if str(key[0]) not in sketch_items or key in sketched}
+        return {
+            item_id: [day for day in days if (int(item_id), day) not in stored]
+            for item_id in item_ids
+        }
+
+    def _stored_days(self, table, server, item_ids, days, condition=""):
+        stored = set()
+        for chunk in chunks([int(item_id) for item_id in item_ids]):
+            placeholders = ",".join("?" * len(chunk))
+            stored.update(self.db.execute(
+                f"SELECT itemid, day FROM {table} WHERE server = ? AND itemid IN ({placeholders})"
+                f" AND day BETWEEN ? AND ?{condition}",
+                [server, *chunk, days[0], days[-1]]
+            ))
+        return stored
+
+    def store(self, server, partials, item_ids, days, sketch_items=None):
+        # Save per-day partials indexed by (itemid, bucket=day start); every
+        # (item, day) without a row is stored as empty, as is the sketch of
+        # every day of the items in sketch_items
+        found = {(int(item_id), int(day)): row for (item_id, day), row in partials.iterrows()}
+        now = time.time()
+        final = {day: int(now >= _day_end(day) + RECHECK_SECONDS) for day in days}
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO daily VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (server, int(item_id), day, *_values(found.get((int(item_id), day))), final[day])
+                    for item_id in item_ids for day in days
+                )
+            )
+            if sketch_items:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO daily_sketches VALUES (?, ?, ?, ?, ?)",
+                    (
+                        (server, int(item_id), day, *_sketch_values(found.get((int(item_id), day))))
+                        for item_id in item_ids if item_id in sketch_items for day in days
+                    )
+                )
+
+    def summarize(self, server, item_ids, first_day, last_day, sketch_items=None):
+        # Rollups of the days first_day..last_day merged into one partial per
+        # item, with the day sketches of items in sketch_items merged too
+        frames = []
+        for chunk in chunks([int(item_id) for item_id in item_ids]):
+            placeholders = ",".join("?" * len(chunk))
+            frames.append(pd.read_sql_query(
+                "SELECT CAST(itemid AS TEXT) AS itemid, MIN(min) AS min, MAX(max) AS max,"
+                " SUM(sum) AS sum, SUM(count) AS count FROM daily"
+                f" WHERE server = ? AND itemid IN ({placeholders}) AND day BETWEEN ? AND ? AND count > 0"
+                " GROUP BY itemid",
+                self.db, params=[server, *chunk, first_day, last_day], index_col="itemid"
+            ))
+        frames = [frame for frame in frames if not frame.empty]
+        partials = pd.concat(frames)[PARTIAL_COLUMNS] if frames else empty_partials()
+        if sketch_items:
+            partials = with_sketches(partials, self._sketches(server, sketch_items, first_day, last_day))
+        return partials
+
+    def _sketches(self, server, item_ids, first_day, last_day):
+        # {itemid: QuantileSketch} merged over the stored day sketches
+        day_sketches = {}
+        for chunk in chunks([int(item_id) for item_id in item_ids]):
+            placeholders = ",".join("?" * len(chunk))
+            for item_id, indexes, weights in self.db.execute(
+                "SELECT itemid, indexes, weights FROM daily_sketches"
+                f" WHERE server = ? AND itemid IN ({placeholders}) AND day BETWEEN ? AND ?",
+                [server, *chunk, first_day, last_day]
+            ):
+                day_sketches.setdefault(str(item_id), []).append(QuantileSketch.from_bytes(indexes, weights))
+        return {item_id: QuantileSketch.merge(sketches) for item_id, sketches in day_sketches.items()}
+
+    def summarize_buckets(self, server, item_ids, days, edges, sketch_items=None):
+        # Rollups merged per bucket (day-aligned bucket starts), indexed by (itemid, bucket)
+        frames = []
+        for start, end in zip(edges, [*edges[1:], days[-1] + 1]):
+            bucket_days = [day for day in days if start <= day < end]
+            if not bucket_days:
+                continue
+            frame = self.summarize(server, item_ids, bucket_days[0], bucket_days[-1], sketch_items)
+            if not frame.empty:
+                frames.append(frame.assign(bucket=start).set_index("bucket", append=True))
+        return pd.concat(frames) if frames else empty_partials()
+
+    def close(self):
+        self.db.close()
+
+
+def _day_end(day):
+    # Start of the local day after the one starting at `day`
+    start = datetime.fromtimestamp(day)
+    return int((start + timedelta(days=1)).replace(hour=0, minute=0, second=0).timestamp())
+
+
+def _values(row):
+    if row is None:
+        return None, None, 0.0, 0.0
+    return float(row["min"]), float(row["max"]), float(row["sum"]), float(row["count"])
+
+
+def _sketch_values(row):
+    if row is None or not isinstance(row.get("sketch"), QuantileSketch):
+        return b"", b""
+    return row["sketch"].to_bytes()
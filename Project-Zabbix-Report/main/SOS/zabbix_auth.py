@@ -0,0 +1,59 @@
+import json
+import os
+import threading
+
+# Authentication for the report scripts. An API token is used as is; for
+# username/password logins the session id is kept in a small JSON file and
+# reused by later runs for as long as the server accepts it, so cron-driven
+# runs skip user.login (slow, password hashing) and do not leave one
+# session per run behind.
+
+DEFAULT_SESSION_FILE = os.path.join(os.path.expanduser("~"), ".zabbix_report_sessions.json")
+
+# Serializes updates of the session file by servers authenticating in parallel
+_SESSION_FILE_LOCK = threading.Lock()
+
+
+def _session_key(url, username):
+    return f"{username}@{url}"
+
+
+def _load_sessions(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _save_sessions(path, sessions):
+    # Written to a private temporary file and renamed, so concurrent runs
+    # never read a half-written file
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(sessions, f)
+    os.replace(tmp_path, path)
+
+
+def authenticate(client, username, password, api_token=None, session_file=None):
+    # Returns True when the session should be kept for the next run and
+    # False when the caller should log out when done
+    if api_token:
+        client.use_api_token(api_token)
+        return True
+    if not session_file:
+        client.login(username, password)
+        return False
+
+    key = _session_key(client.url, username)
+    sessions = _load_sessions(session_file)
+    if key in sessions and client.use_session(sessions[key]):
+        return True
+    session_id = client.login(username, password)
+    # Re-read under the lock so sessions saved meanwhile for other servers are kept
+    with _SESSION_FILE_LOCK:
+        sessions = _load_sessions(session_file)
+        sessions[key] = session_id
+        _save_sessions(session_file, sessions)
+    return True
@@ -0,0 +1,387 @@
+import codecs
+import itertools
+import json
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Connect and read timeouts (seconds) applied to every API call unless overridden
+DEFAULT_TIMEOUT = (10, 300)
+
+# Number of keep-alive connections kept open to the Zabbix frontend
+DEFAULT_POOL_SIZE = 10
+
+# Methods that must be sent without an auth token
+UNAUTHENTICATED_METHODS = {"user.login", "user.checkAuthentication", "apiinfo.version"}
+
+# Bytes read from the socket at a time when streaming a response
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Characters that can continue a JSON number
+_NUMBER_CHARS = "0123456789+-.eE"
+
+# Attempts after the first one for transient failures (connection errors,
+# timeouts, HTTP 429/5xx, truncated responses)
+DEFAULT_RETRIES = 4
+
+# Backoff before retry n is uniform in [0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** n)] seconds
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Methods retried besides the *.get reads. A write such as httptest.create or
+# user.logout may have taken effect before its response was lost, so it is
+# only sent once unless the caller passes retry=True; user.login at worst
+# opens a second session.
+RETRY_METHODS = {"apiinfo.version", "user.checkAuthentication", "user.login"}
+
+# A call slower than this multiple of the usual latency of the same method
+# counts as a sign of frontend overload
+LATENCY_TOLERANCE = 3.0
+
+# Weight of the newest call in the usual latency of a method at a number of
+# calls in flight (an exponentially weighted moving average). Calls of one
+# method vary in size (a short last slice, a small last batch), so the
+# baseline has to follow the calls actually made rather than stick to the
+# fastest one ever seen.
+LATENCY_SMOOTHING = 0.2
+
+# A sustained overload becomes the usual latency at its number of calls in
+# flight, so a call also counts as a sign of overload when its latency grew
+# nearly in proportion to the calls in flight: by more than this share of
+# their ratio, compared with the usual latency at half as many calls or
+# fewer. More calls in flight then no longer get more done.
+LATENCY_SCALING = 0.8
+
+
+class ZabbixAPIError(Exception):
+    def __init__(self, method, error):
+        self.method = method
+        self.code = error.get("code")
+        self.data = error.get("data")
+        super().__init__(f"{method} failed: {error.get('message')} {error.get('data', '')}".strip())
+
+
+class TransientError(requests.RequestException):
+    # Raised when a call still fails after all retries
+    pass
+
+
+class AdaptiveLimiter:
+    # AIMD limit on the number of requests in flight, between 1 and max_limit.
+    # Starts at 1 and doubles per round of successes (slow start) until the
+    # first sign of overload, then grows by about one per round. An error,
+    # timeout or a call much slower than usual halves the limit; "usual" is
+    # the moving average latency of the method with as many calls in flight,
+    # so once latency settles at a new level the limit grows again, unless
+    # it settled there because of the calls in flight (LATENCY_SCALING).
+    def __init__(self, max_limit):
+        self.max_limit = max_limit
+        self.limit = 1.0
+        self.threshold = float(max_limit)
+        self.in_flight = 0
+        # {method: {calls in flight: usual latency}}
+        self.usual_latency = {}
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        # Returns the number of calls in flight, this one included
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+            return self.in_flight
+
+    def release(self, method, started, load, latency=None):
+        # started is the call's time.monotonic() start, load what acquire()
+        # returned, latency None for a failed call. Calls already in flight
+        # when the limit was last cut saw the old load and do not cut it again.
+        with self.condition:
+            self.in_flight -= 1
+            usual = self.usual_latency.setdefault(method, {})
+            lower = max((level for level in usual if level <= load / 2), default=None)
+            overloaded = latency is None or (
+                load in usual and latency > usual[load] * LATENCY_TOLERANCE
+                or lower is not None and latency * lower > usual[lower] * load * LATENCY_SCALING
+            )
+            if latency is not None:
+                usual[load] = latency if load not in usual else (
+                    usual[load] + LATENCY_SMOOTHING * (latency - usual[load])
+                )
+            if overloaded:
+                if started >= self.last_decrease:
+                    self.threshold = max(1.0, self.limit / 2)
+                    self.limit = self.threshold
+                    self.last_decrease = time.monotonic()
+            elif self.limit < self.threshold:
+                self.limit = min(self.max_limit, self.limit + 1)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+
+class ZabbixClient:
+    # Pooled JSON-RPC client shared by all report scripts.
+    # One requests.Session keeps TCP/TLS connections alive between calls and
+    # asks the frontend for gzip-compressed responses. Transient failures of
+    # reads are retried with jittered exponential backoff (see RETRY_METHODS);
+    # with max_concurrency the requests in flight are capped by an
+    # AdaptiveLimiter. With a Metrics object in .metrics every call is
+    # recorded; a MetadataCache in .metadata lets the report engine reuse
+    # host and item lookups.
+    def __init__(self, url, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, verify=True,
+                 retries=DEFAULT_RETRIES, max_concurrency=None):
+        self.url = url
+        self.timeout = timeout
+        self.retries = retries
+        self.limiter = AdaptiveLimiter(max_concurrency) if max_concurrency and max_concurrency > 1 else None
+        self.auth_token = None
+        self.metrics = None
+        self.metadata = None
+        self._request_ids = itertools.count(1)
+
+        self.session = requests.Session()
+        self.session.verify = verify
+        self.session.headers.update({
+            "Content-Type": "application/json-rpc",
+            "Accept-Encoding": "gzip, deflate"
+        })
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _payload(self, method, params):
+        payload = {
+            "jsonrpc": "2.0",
+            "method": method,
+            "params": params if params is not None else {},
+            "id": next(self._request_ids)
+        }
+        if self.auth_token and method not in UNAUTHENTICATED_METHODS:
+            payload["auth"] = self.auth_token
+        return payload
+
+    def _post(self, method, payload, timeout, stream=False):
+        # One HTTP attempt; transient failures are raised as TransientError
+        try:
+            response = self.session.post(self.url, json=payload, timeout=timeout or self.timeout, stream=stream)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise TransientError(f"{method}: {e}") from e
+        if response.status_code in RETRY_STATUS_CODES:
+            response.close()
+            raise TransientError(f"{method}: HTTP {response.status_code}")
+        response.raise_for_status()
+        return response
+
+    def _retries(self, method, retry=None):
+        # Retries allowed for a call; retry=None leaves it to the method
+        if retry is None:
+            retry = method.endswith(".get") or method in RETRY_METHODS
+        return self.retries if retry else 0
+
+    def _with_retries(self, method, attempt, retries):
+        # Run attempt() until it succeeds or the retries are used up, sleeping
+        # a random share of an exponentially growing delay in between
+        for retry in itertools.count():
+            load = self.limiter.acquire() if self.limiter else None
+            started = time.monotonic()
+            try:
+                result = attempt()
+            except TransientError:
+                if self.limiter:
+                    self.limiter.release(method, started, load)
+                if retry >= retries:
+                    raise
+                time.sleep(random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** retry)))
+                continue
+            except BaseException:
+                if self.limiter:
+                    self.limiter.release(method, started, load)
+                raise
+            if self.limiter:
+                self.limiter.release(method, started, load, time.monotonic() - started)
+            return result
+
+    def _record(self, method, started, response=None, rows=None, error=False):
+        # Bytes on the wire: the JSON request body and the (compressed) response body
+        if self.metrics is None:
+            return
+        request_bytes = response_bytes = 0
+        if response is not None:
+            request_bytes = len(response.request.body or b"") if response.request is not None else 0
+            response_bytes = int(response.headers.get("Content-Length") or response.raw.tell())
+        self.metrics.record_call(method, time.perf_counter() - started, request_bytes, response_bytes, rows, error)
+
+    def call(self, method, params=None, timeout=None, retry=None):
+        payload = self._payload(method, params)
+        responses = []
+
+        def attempt():
+            response = self._post(method, payload, timeout)
+            responses.append(response)
+            try:
+                result = response.json()
+            except ValueError as e:
+                # Truncated or non-JSON body, e.g. an HTML error page from a proxy
+                raise TransientError(f"{method}: invalid JSON response") from e
+            if "error" in result:
+                raise ZabbixAPIError(method, result["error"])
+            if "result" not in result:
+                raise TransientError(f"{method}: response has no result")
+            return result["result"]
+
+        started = time.perf_counter()
+        try:
+            result = self._with_retries(method, attempt, self._retries(method, retry))
+        except Exception:
+            self._record(method, started, responses[-1] if responses else None, error=True)
+            raise
+        self._record(method, started, responses[-1], len(result) if isinstance(result, list) else None)
+        return result
+
+    def call_stream(self, method, params=None, timeout=None, retry=None):
+        # Like call(), but yields the elements of a list result one at a time
+        # while the response is still downloading, so large results are never
+        # held in memory as a whole. Only the request itself is retried: once
+        # rows have been handed out a failure is raised to the caller.
+        payload = self._payload(method, params)
+        started = time.perf_counter()
+        rows = 0
+        response = None
+        try:
+            with self._with_retries(
+                method, lambda: self._post(method, payload, timeout, stream=True), self._retries(method, retry)
+            ) as response:
+                for row in _iter_result(method, _iter_text(response)):
+                    rows += 1
+                    yield row
+        except Exception:
+            self._record(method, started, response, rows, error=True)
+            raise
+        self._record(method, started, response, rows)
+
+    def login(self, username, password):
+        self.auth_token = self.call("user.login", {"username": username, "password": password})
+        return self.auth_token
+
+    def use_api_token(self, token):
+        # Zabbix API tokens are sent in the Authorization header; there is no
+        # session to log in to or out of
+        self.auth_token = None
+        self.session.headers["Authorization"] = f"Bearer {token}"
+
+    def use_session(self, session_id):
+        # Reuse a session from an earlier login if the server still accepts it.
+        # user.checkAuthentication is cheap (no password hashing) and extends
+        # the session. Returns False for an expired or unknown session.
+        try:
+            self.call("user.checkAuthentication", {"sessionid": session_id})
+        except ZabbixAPIError:
+            return False
+        self.auth_token = session_id
+        return True
+
+    def logout(self):
+        if self.auth_token:
+            self.call("user.logout", [])
+            self.auth_token = None
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _iter_text(response):
+    # Decoded text chunks of a streamed (possibly gzip-encoded) response
+    decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")()
+    for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+        yield decoder.decode(chunk)
+    yield decoder.decode(b"", final=True)
+
+
+class _JSONStream:
+    # Minimal incremental JSON reader over text chunks. Scalars and small
+    # objects are decoded whole; the caller walks the outer structure.
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = ""
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        # Next non-whitespace character, without consuming it
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON-RPC response")
+
+    def skip(self, char):
+        if self.peek() == char:
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, char):
+        if not self.skip(char):
+            raise ValueError(f"Malformed JSON-RPC response: expected {char!r} at offset {self.pos}")
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number running to the end of the buffer, or cut off after its
+            # "." or "e" (which it was decoded without), may continue in the
+            # next chunk
+            number = isinstance(value, (int, float)) and not isinstance(value, bool)
+            if number and not self.buffer[end:].strip(_NUMBER_CHARS) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def _iter_result(method, chunks):
+    stream = _JSONStream(chunks)
+    envelope = {}
+    stream.expect("{")
+    while not stream.skip("}"):
+        key = stream.value()
+        stream.expect(":")
+        if key == "result" and stream.peek() == "[":
+            stream.expect("[")
+            while not stream.skip("]"):
+                yield stream.value()
+                stream.skip(",")
+            envelope["result"] = None
+        else:
+            envelope[key] = stream.value()
+        stream.skip(",")
+    if "error" in envelope:
+        raise ZabbixAPIError(method, envelope["error"])
+    if "result" not in envelope:
+        raise ValueError(f"{method} response has no result")
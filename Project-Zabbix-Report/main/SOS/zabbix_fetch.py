@@ -0,0 +1,419 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from trend_aggregate import accumulate_trends, bucket_starts, merge_partials, summarize_history, summarize_trends
+from trend_cache import closed_until
+
+# Host, item and trend lookups shared by the report scripts.
+# Every function takes a ZabbixClient and batches its requests so the number
+# of API calls does not grow with the number of hosts or metrics. With
+# concurrency > 1 the batches are issued concurrently, at most `concurrency`
+# requests in flight, and results are returned in batch order.
+
+# Number of host IDs sent per host.get / item.get call
+HOST_BATCH_SIZE = 1000
+
+# Number of item IDs sent per trend.get call
+ITEM_BATCH_SIZE = 500
+
+
+# Seconds in one day, used to cut reporting windows into slices
+DAY_SECONDS = 86400
+
+# Windows up to this long are read from raw history instead of hourly trends
+HISTORY_MAX_SECONDS = 6 * 3600
+
+# Only windows starting this recently are assumed to still be in history
+# (item history is commonly kept for 7 days or more; trends much longer)
+HISTORY_RECENT_SECONDS = 7 * DAY_SECONDS
+
+# Rows per history.get page
+HISTORY_PAGE_SIZE = 100000
+
+# history.get `history` parameter per numeric item value_type
+# (0 = numeric float, 3 = numeric unsigned); other types are not aggregated
+NUMERIC_VALUE_TYPES = ("0", "3")
+
+
+def _call(client, method, params, transform, stream=False):
+    if stream:
+        # transform consumes the result rows while they are still downloading
+        return transform(client.call_stream(method, params))
+    result = client.call(method, params)
+    return transform(result) if transform else result
+
+
+async def _run_bounded(function, args_list, concurrency):
+    # A semaphore bounds the in-flight requests; each call runs in a worker
+    # thread on the client's shared connection pool. The loop's default
+    # executor is capped at min(32, cpu_count + 4) threads, so the calls get
+    # a pool of their own and the semaphore is the only bound.
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        async def bounded_call(args):
+            async with semaphore:
+                return await loop.run_in_executor(executor, functools.partial(function, *args))
+
+        return await asyncio.gather(*(bounded_call(args) for args in args_list))
+
+
+def run_batches(function, args_list, concurrency=1):
+    # function(*args) for every args tuple, at most `concurrency` at a time,
+    # results in the same order
+    if concurrency <= 1 or len(args_list) <= 1:
+        return [function(*args) for args in args_list]
+    return asyncio.run(_run_bounded(function, args_list, concurrency))
+
+
+def call_batches(client, method, params_list, concurrency=1, transform=None, stream=False):
+    # Run one API call per params dict and return the results in the same order.
+    # transform, if given, is applied to each result as soon as it arrives; with
+    # stream=True it receives an iterator over the rows of a streamed response.
+    return run_batches(
+        _call, [(client, method, params, transform, stream) for params in params_list], concurrency
+    )
+
+
+def split_window(time_from, time_till, slice_days=None):
+    # Cut [time_from, time_till] into consecutive non-overlapping slices of slice_days
+    if not slice_days:
+        return [(time_from, time_till)]
+    slice_seconds = int(slice_days * DAY_SECONDS)
+    return [(start, min(start + slice_seconds - 1, time_till))
+            for start in range(time_from, time_till + 1, slice_seconds)]
+
+
+def _group_filter(group_names_or_ids):
+    # Determine whether the input is numeric (host group ID) or name
+    filter_field = "groupid" if all(name.isdigit() for name in group_names_or_ids) else "name"
+    return {filter_field: group_names_or_ids}
+
+
+def get_hosts_from_groups(client, group_names_or_ids):
+    groups = client.call("hostgroup.get", {
+        "output": ["groupid"],
+        "filter": _group_filter(group_names_or_ids),
+        "selectHosts": ["hostid", "host", "name"]
+    })
+
+    # Extract all hosts from the fetched groups, skipping hosts already seen in an earlier group
+    hosts = []
+    seen = set()
+    for group in groups:
+        for host in group.get("hosts", []):
+            if host["hostid"] not in seen:
+                seen.add(host["hostid"])
+                hosts.append(host)
+    return hosts
+
+
+def list_group_hosts(client, group_names_or_ids):
+    # Sorted [hostid, host, name] of the hosts get_hosts_from_groups()
+    # returns, for checking whether cached group members are current. The
+    # names are included so a renamed host is noticed too.
+    groups = client.call("hostgroup.get", {
+        "output": ["groupid"],
+        "filter": _group_filter(group_names_or_ids),
+        "selectHosts": ["hostid", "host", "name"]
+    })
+    return host_signature(host for group in groups for host in group.get("hosts", []))
+
+
+def host_signature(hosts):
+    return sorted({(host["hostid"], host["host"], host["name"]) for host in hosts})
+
+
+def get_host_ips(client, host_ids, concurrency=1):
+    # Resolve the IP of every host in a few batched host.get calls
+    params_list = [{
+        "output": ["hostid"],
+        "selectInterfaces": ["ip", "main"],
+        "hostids": host_ids[start:start + HOST_BATCH_SIZE]
+    } for start in range(0, len(host_ids), HOST_BATCH_SIZE)]
+
+    host_ips = {}
+    for hosts in call_batches(client, "host.get", params_list, concurrency):
+        for host in hosts:
+            interfaces = host.get("interfaces", [])
+            if not interfaces:
+                continue
+            # Prefer the default interface, fall back to the first one
+            main_interface = next((i for i in interfaces if i.get("main") == "1"), interfaces[0])
+            host_ips[host["hostid"]] = main_interface["ip"]
+    return host_ips
+
+
+def get_item_map(client, host_ids, keys, concurrency=1, value_types=None):
+    # Resolve every (host, metric) pair with batched item.get calls over all hosts and keys at once.
+    # value_types, if given, is filled with {itemid: value_type} for history.get.
+    metrics_by_key = {}
+    for metric, key_list in keys.items():
+        for key in key_list:
+            metrics_by_key.setdefault(key, []).append(metric)
+
+    params_list = [{
+        "output": ["itemid", "hostid", "key_", "value_type"],
+        "hostids": host_ids[start:start + HOST_BATCH_SIZE],
+        "filter": {"key_": list(metrics_by_key)}
+    } for start in range(0, len(host_ids), HOST_BATCH_SIZE)]
+
+    item_map = {}
+    if not metrics_by_key:
+        # An empty key filter would match every item of every host
+        return item_map
+    for items in call_batches(client, "item.get", params_list, concurrency):
+        for item in items:
+            if value_types is not None:
+                value_types[item["itemid"]] = item.get("value_type")
+            for metric in metrics_by_key.get(item["key_"], []):
+                item_map.setdefault((item["hostid"], metric), []).append(item["itemid"])
+    return item_map
+
+
+def search_items(client, host_ids, search, concurrency=1):
+    # All items of the hosts whose key matches a wildcard pattern, e.g.
+    # "vfs.fs.dependent.size[*", found with one item.get per host batch
+    params_list = [{
+        "output": ["itemid", "hostid", "key_", "value_type"],
+        "hostids": host_ids[start:start + HOST_BATCH_SIZE],
+        "search": {"key_": search},
+        "searchWildcardsEnabled": True
+    } for start in range(0, len(host_ids), HOST_BATCH_SIZE)]
+
+    items = []
+    for result in call_batches(client, "item.get", params_list, concurrency):
+        items.extend(result)
+    return items
+
+
+def list_item_ids(client, host_ids, keys=None, search=None, concurrency=1):
+    # Sorted IDs of the items get_item_map() (item keys) or search_items()
+    # (wildcard pattern) finds, for checking whether a cached item mapping
+    # is current; item IDs change when items are deleted or recreated
+    if keys is not None and not keys:
+        return []
+    if keys is not None:
+        selection = {"filter": {"key_": list(keys)}}
+    else:
+        selection = {"search": {"key_": search}, "searchWildcardsEnabled": True}
+    params_list = [{
+        "output": ["itemid"],
+        "hostids": host_ids[start:start + HOST_BATCH_SIZE],
+        **selection
+    } for start in range(0, len(host_ids), HOST_BATCH_SIZE)]
+    return sorted({item["itemid"] for items in call_batches(client, "item.get", params_list, concurrency)
+                   for item in items})
+
+
+def _trend_params(item_ids, time_from, time_till, concurrency, slice_days=None):
+    # One trend.get per (item batch, time slice). Smaller item batches give
+    # every concurrent worker a share of the items.
+    windows = split_window(time_from, time_till, slice_days)
+    batches = -(-max(concurrency, 1) // len(windows))
+    batch_size = max(1, min(ITEM_BATCH_SIZE, -(-len(item_ids) // batches)))
+    return [{
+        "output": ["itemid", "clock", "num", "value_min", "value_avg", "value_max"],
+        "itemids": item_ids[start:start + batch_size],
+        "time_from": window_from,
+        "time_till": window_till
+    } for start in range(0, len(item_ids), batch_size) for window_from, window_till in windows]
+
+
+def plan_sources(time_from, time_till, source="auto", now=None):
+    # Split [time_from, time_till] into ("trend" | "history", from, till) parts.
+    # auto: short recent windows come from history; longer ones from trends
+    # for the closed hours and from history for the hour(s) trends do not
+    # cover yet, cut on the hour so no value is counted twice.
+    if source != "auto":
+        return [(source, time_from, time_till)]
+    now = time.time() if now is None else now
+    if time_till - time_from + 1 <= HISTORY_MAX_SECONDS and time_from >= now - HISTORY_RECENT_SECONDS:
+        return [("history", time_from, time_till)]
+    boundary = closed_until(now) + 1
+    if time_till < boundary:
+        return [("trend", time_from, time_till)]
+    if time_from >= boundary:
+        return [("history", time_from, time_till)]
+    return [("trend", time_from, boundary - 1), ("history", boundary, time_till)]
+
+
+def get_summary(client, item_ids, value_types, time_from, time_till, concurrency=1, slice_days=None, cache=None,
+                stream=False, source="auto", edges=None, rollups=None, sketch_items=None):
+    # Per-item partial aggregates over the window, from trends, history or both
+    # as chosen by plan_sources(); all parts merge through merge_partials().
+    # With bucket edges (trend_aggregate.bucket_starts) the partials are kept
+    # per (itemid, bucket) from the same single fetch. With DailyRollups the
+    # whole days of the trend part are answered from rollups. Items in
+    # sketch_items also get a quantile sketch (for percentile columns).
+    partials = []
+    for method, part_from, part_till in plan_sources(time_from, time_till, source):
+        if method == "history":
+            partials.append(get_history_summary(
+                client, item_ids, value_types, part_from, part_till, concurrency, edges, sketch_items
+            ))
+        elif rollups is not None:
+            partials.append(get_rollup_summary(
+                client, rollups, item_ids, part_from, part_till, concurrency, slice_days, cache, stream, edges,
+                sketch_items
+            ))
+        else:
+            partials.append(get_trend_summary(
+                client, item_ids, part_from, part_till, concurrency, slice_days, cache, stream, edges, sketch_items
+            ))
+    return merge_partials(partials)
+
+
+def whole_days(time_from, time_till, now=None):
+    # (start, end) of every local day inside [time_from, time_till] whose last
+    # hour of trends is final; end is the last second of the day
+    final_till = min(time_till, closed_until(now))
+    starts = bucket_starts(time_from, final_till + 2 * DAY_SECONDS, "day")
+    return [
+        (start, next_start - 1) for start, next_start in zip(starts, starts[1:])
+        if start >= time_from and next_start - 1 <= final_till
+    ]
+
+
+def get_rollup_summary(client, rollups, item_ids, time_from, time_till, concurrency=1, slice_days=None, cache=None,
+                       stream=False, edges=None, sketch_items=None):
+    # Whole days come from the rollup store; days not rolled up yet are
+    # fetched once (per run of consecutive days) as per-day partials and
+    # stored. The partial days at either end are fetched as usual.
+    days = whole_days(time_from, time_till)
+    if not days:
+        return get_trend_summary(client, item_ids, time_from, time_till, concurrency, slice_days, cache, stream,
+                                 edges, sketch_items)
+    first_day, last_till = days[0][0], days[-1][1]
+    day_starts = [start for start, _ in days]
+    day_ends = dict(days)
+
+    partials = []
+    if time_from < first_day:
+        partials.append(get_trend_summary(
+            client, item_ids, time_from, first_day - 1, concurrency, slice_days, cache, stream, edges, sketch_items
+        ))
+    if last_till < time_till:
+        partials.append(get_trend_summary(
+            client, item_ids, last_till + 1, time_till, concurrency, slice_days, cache, stream, edges, sketch_items
+        ))
+
+    # Items usually miss the same days, so group them and fetch each run of days once
+    items_by_runs = {}
+    for item_id, missing in rollups.missing_days(client.url, item_ids, day_starts, sketch_items).items():
+        runs = []
+        for day in missing:
+            if runs and day == day_ends[runs[-1][-1]] + 1:
+                runs[-1].append(day)
+            else:
+                runs.append([day])
+        for run in runs:
+            items_by_runs.setdefault(tuple(run), []).append(item_id)
+    for run, run_items in items_by_runs.items():
+        daily = get_trend_summary(
+            client, run_items, run[0], day_ends[run[-1]], concurrency, slice_days, cache, stream, list(run),
+            sketch_items
+        )
+        rollups.store(client.url, daily, run_items, run, sketch_items)
+
+    if edges is None:
+        partials.append(rollups.summarize(client.url, item_ids, first_day, day_starts[-1], sketch_items))
+    else:
+        partials.append(rollups.summarize_buckets(client.url, item_ids, day_starts, edges, sketch_items))
+    return merge_partials(partials)
+
+
+def get_history_summary(client, item_ids, value_types, time_from, time_till, concurrency=1, edges=None,
+                        sketch_items=None):
+    # history.get only returns items of the value type it is asked for, so
+    # items are grouped by type and each group is fetched in item batches
+    args_list = []
+    for value_type in NUMERIC_VALUE_TYPES:
+        typed_ids = [item_id for item_id in item_ids if value_types.get(item_id) == value_type]
+        for start in range(0, len(typed_ids), ITEM_BATCH_SIZE):
+            args_list.append(
+                (client, typed_ids[start:start + ITEM_BATCH_SIZE], value_type, time_from, time_till, edges,
+                 sketch_items)
+            )
+    return merge_partials(run_batches(_history_batch_summary, args_list, concurrency))
+
+
+def _history_batch_summary(client, item_ids, value_type, time_from, time_till, edges=None, sketch_items=None):
+    # Page through history.get in clock order with `limit`. A full page may
+    # end in the middle of a second, so its last second is dropped and
+    # fetched again as the start of the next page.
+    partials = []
+    while True:
+        rows = client.call("history.get", {
+            "output": ["itemid", "clock", "value"],
+            "history": int(value_type),
+            "itemids": item_ids,
+            "time_from": time_from,
+            "time_till": time_till,
+            "sortfield": "clock",
+            "sortorder": "ASC",
+            "limit": HISTORY_PAGE_SIZE
+        })
+        if len(rows) < HISTORY_PAGE_SIZE:
+            partials.append(summarize_history(rows, edges, sketch_items))
+            return merge_partials(partials)
+        last_clock = int(rows[-1]["clock"])
+        complete = [row for row in rows if int(row["clock"]) < last_clock]
+        if not complete:
+            # A whole page within one second: keep it and move past that second
+            complete, last_clock = rows, last_clock + 1
+        partials.append(summarize_history(complete, edges, sketch_items))
+        time_from = last_clock
+
+
+def get_trend_summary(client, item_ids, time_from, time_till, concurrency=1, slice_days=None, cache=None,
+                      stream=False, edges=None, sketch_items=None):
+    # Fetch trends slice by slice and reduce each response to per-item partial
+    # aggregates as it arrives, so long windows never hold every row at once.
+    # With stream=True rows are folded into running aggregates while the
+    # response is decoded, so not even one response is held in memory.
+    # With a TrendCache, closed hours come from the cache and only the gaps
+    # are fetched; the still-open current hour is always fetched fresh.
+    if cache is None:
+        params_list = _trend_params(item_ids, time_from, time_till, concurrency, slice_days)
+        transform = functools.partial(
+            accumulate_trends if stream else summarize_trends, edges=edges, sketch_items=sketch_items
+        )
+        return merge_partials(call_batches(client, "trend.get", params_list, concurrency, transform, stream))
+
+    cached_till = min(time_till, closed_until())
+    partials = []
+    if time_from <= cached_till:
+        _fill_cache_gaps(client, cache, item_ids, time_from, cached_till, concurrency, slice_days, stream)
+        partials.append(cache.summarize(client.url, item_ids, time_from, cached_till, edges, sketch_items))
+    if cached_till < time_till:
+        partials.append(get_trend_summary(
+            client, item_ids, max(time_from, cached_till + 1), time_till, concurrency, slice_days, stream=stream,
+            edges=edges, sketch_items=sketch_items
+        ))
+    return merge_partials(partials)
+
+
+def _fill_cache_gaps(client, cache, item_ids, time_from, time_till, concurrency, slice_days, stream=False):
+    # Items usually share the same gaps, so group them and fetch each gap once
+    items_by_gap = {}
+    for item_id in item_ids:
+        for gap in cache.missing_spans(client.url, item_id, time_from, time_till):
+            items_by_gap.setdefault(gap, []).append(item_id)
+
+    params_list = []
+    for (gap_from, gap_till), gap_items in items_by_gap.items():
+        params_list.extend(_trend_params(gap_items, gap_from, gap_till, concurrency, slice_days))
+
+    # Each batch is stored as soon as it is fetched; streamed rows go straight
+    # into SQLite without being collected first
+    if stream:
+        for params in params_list:
+            cache.store(client.url, client.call_stream("trend.get", params), params["itemids"],
+                        params["time_from"], params["time_till"])
+        return
+    for params, trends in zip(params_list, call_batches(client, "trend.get", params_list, concurrency)):
+        cache.store(client.url, trends, params["itemids"], params["time_from"], params["time_till"])
@@ -0,0 +1,47 @@
+import json
+import os
+import sys
+
+import pytest
+
+# The shared Zabbix client lives next to the report scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "main", "SOS"))
+from zabbix_client import ZabbixAPIError, _iter_result
+
+# Streamed responses, each read back with a chunk boundary at every offset
+RESPONSES = [
+    '{"result":[2.5]}',
+    '{"result":[1e3]}',
+    '{"jsonrpc": "2.0", "result": [12, -3.25, 6.02E+23, 1e-7, 0, true, null], "id": 1}',
+    '{"result":[{"itemid":"1001","clock":"1704067200","value_avg":"12.5"},{"itemid":"1002","num":60}]}',
+    '{"result": [ "a \\"quoted\\" string", {"nested": [1, 2.0, {"x": -0.5}]} ], "id": 7}',
+    '{"result":[]}',
+    '{"id": 3, "result": 42}'
+]
+
+
+def _splits(text):
+    # The text as two chunks at every offset, and one character at a time
+    for offset in range(len(text) + 1):
+        yield [text[:offset], text[offset:]]
+    yield list(text)
+
+
+@pytest.mark.parametrize("response", RESPONSES)
+def test_iter_result_at_every_chunk_boundary(response):
+    result = json.loads(response)["result"]
+    expected = result if isinstance(result, list) else []
+    for chunks in _splits(response):
+        assert list(_iter_result("trend.get", chunks)) == expected, chunks
+
+
+def test_iter_result_raises_api_errors_at_every_chunk_boundary():
+    response = '{"jsonrpc":"2.0","error":{"code":-32602,"message":"Invalid params.","data":"No permissions."},"id":1}'
+    for chunks in _splits(response):
+        with pytest.raises(ZabbixAPIError):
+            list(_iter_result("trend.get", chunks))
+
+
+def test_iter_result_rejects_a_truncated_number():
+    with pytest.raises(ValueError):
+        list(_iter_result("trend.get", ['{"result":[2.']))